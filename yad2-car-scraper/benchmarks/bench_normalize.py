@@ -0,0 +1,19 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from feeds import make_items
+from yad2.listings import normalize_listings
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000, 200000]
+    # pandas is only imported on first use, keep that out of the timings
+    normalize_listings(make_items(10))
+    for size in sizes:
+        items = make_items(size)
+        start = time.perf_counter()
+        normalize_listings(items)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>8} listings: {elapsed:.3f}s ({elapsed / size * 1e6:.1f} us/listing)")
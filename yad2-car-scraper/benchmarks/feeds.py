@@ -0,0 +1,81 @@
+import glob
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+CITIES = ["תל אביב יפו", "חיפה", "ירושלים", "באר שבע", "ראשון לציון", "נתניה", "פתח תקווה", "אשדוד",
+          "חולון", "רמת גן", "כפר סבא", "מודיעין מכבים רעות"]
+MODELS = {
+    "יונדאי i30": ["1.6 Premium", "1.6 Prestige", "1.6 Inspire", "1.6 Luxury"],
+    "קיה סיד": ["1.6 LX", "1.6 EX", "1.6 Premium", "1.6 GT Line"],
+    "טויוטה קורולה": ["1.8 Hybrid Sun", "1.8 Hybrid Style", "1.8 Hybrid Executive"],
+}
+COMPANIES = ["סוחר", "פרטי", "טרייד מוביל", "אלבר", "קרסו"]
+OWNERS = ["פרטית", "ליסינג", "השכרה", "חברה"]
+NAMES = ["משה", "דני", "יוסי", "רונית", "מיכל", "אבי", "נועה", "שרון"]
+INFO_PHRASES = ["רכב שמור", "טסט עד 2025", "יד ראשונה מהיבואן", "ללא תאונות", "טיפולים במוסך מורשה",
+                "צמיגים חדשים", "מולטימדיה", "מצלמת רוורס", "חיישני חניה", "גג נפתח", "מחיר סופי"]
+
+def make_item(rng, i, date):
+    model = rng.choice(list(MODELS))
+    return {
+        "id": f"ad{i:08d}",
+        "line_2": rng.choice(COMPANIES),
+        "city": rng.choice(CITIES),
+        "row_1": model,
+        "row_2": rng.choice(MODELS[model]),
+        "year": rng.choice([2022, 2023, 2024]),
+        "Hand_text": f"יד {rng.randint(1, 3)}",
+        "kilometers": f"{rng.randint(1, 50000):,}",
+        "price": f"{rng.randint(80000, 160000):,} ₪" if rng.random() > 0.05 else "לא צוין מחיר",
+        "contact_name": rng.choice(NAMES),
+        "info_text": ", ".join(rng.sample(INFO_PHRASES, rng.randint(2, 6))),
+        "search_text": f"{model} {rng.choice(CITIES)}",
+        "date": date.strftime("%Y-%m-%d %H:%M:%S"),
+        "date_added": (date - timedelta(days=rng.randint(0, 60))).strftime("%Y-%m-%d %H:%M:%S"),
+        "OwnerID_text": rng.choice(OWNERS),
+        "pricelist_link_url": f"https://www.yad2.co.il/pricelist/{rng.randint(1000, 9999)}",
+        "images_urls": [f"https://img.yad2.co.il/Pic/202401/01/2_1/o/y2_{i}_{n}.jpg" for n in range(rng.randint(1, 8))],
+        "more_details": [
+            {"name": "month", "value": str(rng.randint(1, 12))},
+            {"name": "engineval", "value": "1,598"},
+            {"name": "color", "value": rng.choice(["לבן", "שחור", "כסוף", "אפור"])},
+        ],
+    }
+
+def make_items(count, seed=0):
+    # Newest first, like the date ordered Yad2 feed
+    rng = random.Random(seed)
+    start = datetime(2024, 6, 1, 12, 0, 0)
+    return [make_item(rng, i, start - timedelta(minutes=i)) for i in range(count)]
+
+def make_pages(items, per_page=2000):
+    last_page = max((len(items) + per_page - 1) // per_page, 1)
+    return [{
+        "data": {
+            "pagination": {
+                "current_page": page,
+                "last_page": last_page,
+                "max_items_per_page": per_page,
+                "total_items": len(items),
+            },
+            "feed": {"feed_items": items[(page - 1) * per_page:page * per_page]},
+        }
+    } for page in range(1, last_page + 1)]
+
+def load_recorded_pages(directory):
+    # Responses saved by run.py --record, one page_<n>.json per page
+    filenames = glob.glob(os.path.join(directory, "page_*.json"))
+    filenames.sort(key=lambda filename: int(os.path.basename(filename)[len("page_"):-len(".json")]))
+    pages = []
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as page_file:
+            pages.append(json.load(page_file))
+    return pages
+
+def save_recorded_pages(directory, pages):
+    os.makedirs(directory, exist_ok=True)
+    for page_number, data in enumerate(pages, start=1):
+        with open(os.path.join(directory, f"page_{page_number}.json"), "w", encoding="utf-8") as page_file:
+            json.dump(data, page_file, ensure_ascii=False)
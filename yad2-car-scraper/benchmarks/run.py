@@ -0,0 +1,202 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, ".."))
+
+from yad2.config import BASE_URL, SCRAPER_MAX_WORKERS, SCRAPER_RATE_LIMIT, STREAM_CHUNK_SIZE
+from yad2.crawl import build_params, default_specs
+from yad2.schema import unique_items
+from yad2.scoring import score_listings
+from yad2.scraper import Yad2CarScraper
+from yad2.storage import JsonLinesSink, chunked, stream_listings
+from yad2.web import create_app
+from feeds import load_recorded_pages, make_items, make_pages, save_recorded_pages
+from stub_server import StubFeedServer
+
+def best_time(function, repeat, setup=None):
+    # Best of repeat runs, setup runs untimed before each one and the stage output is silenced
+    times = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+    return min(times), result
+
+def deep_size(obj, seen=None):
+    # Bytes of an object and everything it holds, shared objects such as interned strings count once
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(value, seen) for value in obj)
+    return size
+
+def listings_query(columns):
+    query = {"draw": 1, "start": 0, "length": 10, "manufacturer": "Hyundai",
+             "order[0][column]": columns.index("price"), "order[0][dir]": "asc"}
+    for i, column in enumerate(columns):
+        query[f"columns[{i}][data]"] = column
+        query[f"columns[{i}][search][value]"] = "חיפה" if column == "city" else ""
+    return query
+
+def clear_caches(state):
+    state.snapshot_cache.snapshots.entries.clear()
+    state.regression_cache.entries.clear()
+    state.plot_renderer.images.entries.clear()
+
+def run_pipeline(name, pages, repeat, workers):
+    stages = {}
+    # Warmed up before timing, so that no stage pays for importing its dependencies
+    app = create_app(history_db="bench.db", dataset_dir="bench_datasets", image_dir="bench_images",
+                     refresh=False, warm_up=False)
+    state = app.extensions["yad2"]
+    state.warm_up()
+    client = app.test_client()
+    with StubFeedServer(pages) as server:
+        scraper = Yad2CarScraper(server.url, {}, max_workers=workers)
+        stages["scrape"], _ = best_time(scraper.scrape, repeat)
+        requests_made = server.requests
+
+    stages["dedup"], _ = best_time(lambda: unique_items(scraper.all_items), repeat)
+    stages["normalize"], df = best_time(scraper.to_dataframe, repeat)
+    stages["scoring"], _ = best_time(lambda: score_listings(df), repeat)
+    stages["save_jsonl"], _ = best_time(lambda: save_jsonl(scraper), repeat)
+    stages["save_parquet"], _ = best_time(lambda: scraper.save_to_parquet("bench.parquet"), repeat)
+    stages["save_to_excel"], _ = best_time(lambda: scraper.save_to_excel("bench.xlsx"), repeat)
+
+    def fresh_snapshot():
+        # A new dataset version is opened from its file and has none of the search columns,
+        # sort orders or cached results
+        clear_caches(state)
+        state.registry.publish_frame(state.dataset_keys["Hyundai"], df)
+
+    stages["render_index"], response = best_time(lambda: client.get("/"), repeat, setup=fresh_snapshot)
+    index_bytes = len(response.data)
+
+    query = listings_query(list(df.columns))
+    listings = lambda: client.get("/api/listings", query_string=query)
+    stages["api_listings_cold"], _ = best_time(listings, repeat, setup=fresh_snapshot)
+    stages["api_listings_warm"], response = best_time(listings, repeat)
+    listings_bytes = len(response.data)
+
+    regression = lambda: client.post("/linear_regression", data={"manufacturer": "Hyundai", "city": "חיפה"})
+    stages["linear_regression_cold"], _ = best_time(regression, repeat, setup=fresh_snapshot)
+    stages["linear_regression_warm"], _ = best_time(regression, repeat)
+
+    return {
+        "dataset": name,
+        "listings": len(df),
+        "feed_requests": requests_made,
+        # Memory per listing of the crawled items and of the listings table
+        "item_bytes_per_listing": round(deep_size(scraper.all_items) / max(len(scraper.all_items), 1)),
+        "frame_bytes_per_listing": round(df.memory_usage(deep=True).sum() / max(len(df), 1)),
+        "index_bytes": index_bytes,
+        "api_listings_bytes": listings_bytes,
+        "stages": {stage: round(seconds, 6) for stage, seconds in stages.items()},
+    }
+
+def save_jsonl(scraper):
+    with JsonLinesSink("bench.jsonl") as sink:
+        stream_listings(chunked(scraper.all_items, STREAM_CHUNK_SIZE), [sink])
+
+def record(directory, manufacturer):
+    spec = next(spec for spec in default_specs() if spec.name == manufacturer)
+    scraper = Yad2CarScraper(BASE_URL, build_params(spec), max_workers=SCRAPER_MAX_WORKERS,
+                             rate_limit=SCRAPER_RATE_LIMIT)
+    first_page = scraper.fetch_page(1)
+    if not first_page:
+        sys.exit("Failed to retrieve data from the first page.")
+    last_page = first_page["data"].get("pagination", {}).get("last_page", 1)
+    pages = [first_page] + scraper.fetch_pages(range(2, last_page + 1))
+    # A recording with a missing page would be renumbered and replay a different feed
+    failed = [page_number for page_number, page in enumerate(pages, 1) if not page]
+    if failed:
+        sys.exit(f"Failed to retrieve pages {', '.join(map(str, failed))}, nothing was recorded.")
+    save_recorded_pages(directory, pages)
+    print(f"Recorded {len(pages)} pages of {manufacturer} to '{directory}'.")
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline_file, report):
+    with open(baseline_file, "r", encoding="utf-8") as baseline_json:
+        baseline = {result["dataset"]: result for result in json.load(baseline_json)["results"]}
+    print(f"{'dataset':<20} {'stage':<24} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for result in report["results"]:
+        old = baseline.get(result["dataset"])
+        if old is None:
+            continue
+        for stage, seconds in result["stages"].items():
+            old_seconds = old["stages"].get(stage)
+            if old_seconds is None:
+                continue
+            ratio = seconds / old_seconds if old_seconds else float("inf")
+            print(f"{result['dataset']:<20} {stage:<24} {old_seconds:>10.4f} {seconds:>10.4f} {ratio:>6.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the scrape, persist, page and regression stages")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[1000, 10000, 100000],
+                        help="listing counts of the synthetic feeds")
+    parser.add_argument("--fixtures", nargs="*", default=[], help="directories of recorded feed pages to replay")
+    parser.add_argument("--per-page", type=int, default=2000, help="listings per synthetic feed page")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one is reported")
+    parser.add_argument("--workers", type=int, default=SCRAPER_MAX_WORKERS, help="concurrent page fetches")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--record", metavar="DIR", help="record the live feed of --manufacturer into DIR and exit")
+    parser.add_argument("--manufacturer", default="Hyundai")
+    args = parser.parse_args()
+
+    if args.record:
+        record(os.path.abspath(args.record), args.manufacturer)
+        sys.exit()
+
+    datasets = [(f"synthetic-{size}", make_pages(make_items(size), args.per_page)) for size in args.sizes]
+    datasets += [(f"recorded-{os.path.basename(os.path.normpath(directory))}", load_recorded_pages(directory))
+                 for directory in args.fixtures]
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "results": [],
+    }
+    # Every file the pipeline writes goes to a scratch directory
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        for name, pages in datasets:
+            result = run_pipeline(name, pages, args.repeat, args.workers)
+            report["results"].append(result)
+            print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+        os.chdir(BENCHMARKS_DIR)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    if baseline:
+        compare(baseline, report)
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Served instead of a page: status None serves the page itself after waiting delay seconds
+Fault = namedtuple("Fault", ["status", "headers", "delay"], defaults=[None, {}, 0])
+
+class StubFeedServer:
+    # Serves prepared feed-search-legacy responses on localhost, selected by the page parameter.
+    # faults maps a page number to the faults its next requests get, one per request.
+    def __init__(self, pages, faults=None):
+        self.bodies = [json.dumps(page, ensure_ascii=False).encode("utf-8") for page in pages]
+        self.faults = {page: list(page_faults) for page, page_faults in (faults or {}).items()}
+        self.requests = 0
+        self.requested_pages = []
+        self.lock = threading.Lock()
+        bodies = self.bodies
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                page = int(query.get("page", ["1"])[0])
+                with server.lock:
+                    server.requests += 1
+                    server.requested_pages.append(page)
+                    page_faults = server.faults.get(page)
+                    fault = page_faults.pop(0) if page_faults else Fault()
+                time.sleep(fault.delay)
+                if fault.status is not None:
+                    self.send_empty(fault.status, fault.headers)
+                    return
+                if not 1 <= page <= len(bodies):
+                    self.send_empty(404, {})
+                    return
+                body = bodies[page - 1]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_empty(self, status, headers):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/feed-search-legacy/vehicles/cars"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class StubImageServer:
+    # Serves images on localhost by path, other paths get 404
+    def __init__(self, images):
+        self.images = dict(images)
+        self.requests = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                body = server.images.get(urlparse(self.path).path)
+                self.send_response(200 if body is not None else 404)
+                self.send_header("Content-Length", str(len(body or b"")))
+                self.end_headers()
+                self.wfile.write(body or b"")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# The stub feed server and synthetic feeds are shared with the benchmarks
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import yad2.crawl
+from feeds import make_items, make_pages
+from stub_server import StubFeedServer
+from yad2.web import create_app
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    # Every manufacturer is crawled from the stub, all files are written to tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(yad2.crawl, "IMAGE_PREFETCH_LIMIT", 0)
+    with StubFeedServer(make_pages(make_items(50), 25)) as server:
+        monkeypatch.setattr(yad2.crawl, "BASE_URL", server.url)
+        yield server
+
+@pytest.fixture
+def make_app(tmp_path):
+    # Apps whose databases, datasets and images are in tmp_path
+    def make(**kwargs):
+        return create_app(history_db=str(tmp_path / "history.db"), dataset_dir=str(tmp_path / "datasets"),
+                          image_dir=str(tmp_path / "images"), warm_up=False, **kwargs)
+    return make
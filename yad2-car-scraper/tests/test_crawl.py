@@ -0,0 +1,29 @@
+import pandas as pd
+
+from feeds import make_items, make_pages
+from stub_server import StubFeedServer
+from yad2.crawl import CrawlSpec, crawl, merge_crawls
+from yad2.listings import normalize_listings
+
+def frame(source, *pages):
+    df = pd.concat([normalize_listings(items) for items in pages], ignore_index=True)
+    df.insert(0, "source", source)
+    return df
+
+def test_merge_crawls_tags_each_listing_once_per_spec():
+    items = make_items(6)
+    merged = merge_crawls([frame("Hyundai", items[:4], items[:1]), frame("KIA", items[2:])])
+    assert list(merged["ad_id"]) == [item["id"] for item in items]
+    assert list(merged["source"].astype(str)) == ["Hyundai", "Hyundai", "Hyundai,KIA", "Hyundai,KIA", "KIA", "KIA"]
+
+def test_crawl_drops_listings_repeated_across_pages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    items = make_items(50)
+    pages = make_pages(items, 25)
+    # The first listing of page 2 moved there from page 1 while crawling
+    pages[1]["data"]["feed"]["feed_items"].insert(0, items[24])
+    with StubFeedServer(pages) as server:
+        monkeypatch.setattr("yad2.crawl.BASE_URL", server.url)
+        df = crawl([CrawlSpec("Hyundai", 21, 10291, {}), CrawlSpec("KIA", 48, 10720, {})], max_workers=2)
+    assert sorted(df["ad_id"]) == sorted(item["id"] for item in items)
+    assert set(df["source"].astype(str)) == {"Hyundai,KIA"}
@@ -0,0 +1,21 @@
+import time
+
+import pandas as pd
+
+from feeds import make_items
+from yad2.history import PriceHistory
+from yad2.listings import normalize_listings
+
+def test_rolling_median_of_the_model_history(tmp_path):
+    history = PriceHistory(str(tmp_path / "history.db"))
+    df = normalize_listings(make_items(30))
+    df["model"] = df["model"].cat.set_categories(["a"]).fillna("a")
+    now = time.time()
+    # Crawls an hour apart with median prices 100, 100 and 400, then one with 130
+    for hours, price in [(4, 100), (3, 100), (2, 400), (1, 130)]:
+        history.append_snapshot(df.assign(price=pd.array([price] * len(df), dtype="Int64")),
+                                now - hours * 3600, "test")
+    rows = history.model_history("a", window=7)
+    assert [row["median_price"] for row in rows] == [100, 100, 400, 130]
+    assert [row["rolling_median_price"] for row in rows] == [100, 100, 100, 115]
+    assert [row["listings"] for row in rows] == [30] * 4
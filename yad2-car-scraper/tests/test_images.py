@@ -0,0 +1,102 @@
+import io
+import math
+import os
+import sqlite3
+import time
+
+import pytest
+from PIL import Image
+
+import yad2.crawl
+from feeds import make_items, make_pages
+from stub_server import StubFeedServer, StubImageServer
+from yad2.images import ImageCache
+
+THUMBNAIL_SIZE = (480, 360)
+
+def png(color, size=(1200, 900)):
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="PNG")
+    return output.getvalue()
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCache(str(tmp_path / "images"), 10 ** 9, THUMBNAIL_SIZE)
+
+def test_identical_images_share_a_thumbnail(cache):
+    first = cache.store("https://example.com/1.png", png("red"))
+    second = cache.store("https://example.com/2.png", png("red"))
+    assert first == second
+    assert len(cache.files()) == 1
+    assert cache.lookup(["https://example.com/1.png", "https://example.com/2.png", "https://example.com/3.png"]) == {
+        "https://example.com/1.png": first, "https://example.com/2.png": first}
+    with Image.open(cache.load(first)) as thumbnail:
+        assert thumbnail.format == "JPEG" and thumbnail.size == THUMBNAIL_SIZE
+
+def test_least_recently_served_thumbnails_are_evicted(cache):
+    hashes = {color: cache.store(f"https://example.com/{color}.png", png(color)) for color in ["red", "green", "blue"]}
+    now = time.time()
+    for age, color in enumerate(["blue", "green", "red"], 1):
+        os.utime(cache.path(hashes[color]), (now - age * 24 * 60 * 60,) * 2)
+    # Serving the oldest thumbnail makes it the most recently used
+    cache.load(hashes["red"])
+    sizes = {color: os.path.getsize(cache.path(image_hash)) for color, image_hash in hashes.items()}
+    # Room for everything but the green thumbnail once the yellow one is added
+    yellow_size = len(cache.thumbnail(png("yellow")))
+    cache.max_bytes = math.ceil((sum(sizes.values()) + yellow_size - sizes["green"]) / 0.9)
+    cache.store("https://example.com/yellow.png", png("yellow"))
+    assert not os.path.exists(cache.path(hashes["green"]))
+    assert all(os.path.exists(cache.path(hashes[color])) for color in ["red", "blue"])
+    assert set(cache.lookup(f"https://example.com/{color}.png" for color in hashes)) == {
+        "https://example.com/red.png", "https://example.com/blue.png"}
+
+@pytest.fixture
+def image_feed(tmp_path, monkeypatch):
+    # Listings whose images are on a stub host: one image, one missing and one that is not an image
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(yad2.crawl, "IMAGE_PREFETCH_LIMIT", 0)
+    with StubImageServer({"/car.png": png("red"), "/broken.png": b"not an image"}) as images:
+        items = make_items(10)
+        for item in items:
+            item["images_urls"] = [f"{images.url}/{name}.png" for name in ["car", "missing", "broken"]]
+        with StubFeedServer(make_pages(items, 10)) as server:
+            monkeypatch.setattr(yad2.crawl, "BASE_URL", server.url)
+            yield images, items
+
+def listing_images(client, ad_id):
+    response = client.get(f"/api/listings/{ad_id}/images", query_string={"manufacturer": "KIA"})
+    assert response.status_code == 200
+    return response.get_json()["images"]
+
+def test_images_are_served_as_thumbnails(image_feed, make_app):
+    images, items = image_feed
+    client = make_app(refresh=False).test_client()
+    urls = items[0]["images_urls"]
+    thumbnail_url, *fallbacks = listing_images(client, items[0]["id"])
+    # Images that could not be fetched are linked at their source
+    assert thumbnail_url.startswith("/img/") and fallbacks == urls[1:]
+    assert images.requests == 3
+
+    response = client.get(thumbnail_url)
+    assert response.status_code == 200 and response.mimetype == "image/jpeg"
+    assert "immutable" in response.headers["Cache-Control"]
+    with Image.open(io.BytesIO(response.data)) as thumbnail:
+        assert thumbnail.size == THUMBNAIL_SIZE
+    etag = response.headers["ETag"]
+    assert client.get(thumbnail_url, headers={"If-None-Match": etag}).status_code == 304
+
+    # Cached thumbnails are not fetched again
+    assert listing_images(client, items[1]["id"])[0] == thumbnail_url
+    assert images.requests == 5
+    assert client.get("/img/" + "0" * 64).status_code == 404
+    assert client.get("/img/..%2Findex.db").status_code == 404
+
+def test_images_are_linked_at_their_source_when_the_cache_fails(image_feed, make_app, monkeypatch):
+    _, items = image_feed
+    app = make_app(refresh=False)
+
+    def locked(url, data):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(app.extensions["yad2"].image_cache, "store", locked)
+    assert listing_images(app.test_client(), items[0]["id"]) == items[0]["images_urls"]
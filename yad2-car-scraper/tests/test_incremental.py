@@ -0,0 +1,66 @@
+import copy
+
+from feeds import make_items, make_pages
+from stub_server import StubFeedServer
+import yad2.scraper
+from yad2.scraper import ListingStore, Yad2CarScraper
+
+def crawl(pages, store_filename, served_pages=None):
+    # served_pages leaves the remaining pages out, they are answered with 404
+    with StubFeedServer(pages[:served_pages]) as server:
+        scraper = Yad2CarScraper(server.url, {}, max_workers=2)
+        delta = scraper.scrape_incremental(ListingStore(store_filename))
+        return delta, scraper, server.requests
+
+def test_first_crawl_adds_everything(tmp_path):
+    items = make_items(300)
+    delta, _, _ = crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    assert len(delta.added) == 300 and not delta.changed and not delta.removed
+    store = ListingStore(str(tmp_path / "store.db"))
+    assert [item["id"] for item in store.items()] == [item["id"] for item in items]
+
+def test_unchanged_feed_stops_at_the_first_known_page(tmp_path):
+    pages = make_pages(make_items(300), 100)
+    crawl(pages, str(tmp_path / "store.db"))
+    delta, _, requests = crawl(pages, str(tmp_path / "store.db"))
+    assert delta == ([], [], [], 1) and requests == 1
+    assert len(ListingStore(str(tmp_path / "store.db"))) == 300
+
+def test_changed_added_and_removed_listings(tmp_path):
+    items = make_items(300)
+    crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    items = copy.deepcopy(items)
+    items[0]["price"] = "1,000 ₪"
+    sold = items.pop(1)
+    new = dict(items[2], id="new")
+    items.insert(0, new)
+    delta, _, _ = crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    assert delta.added == ["new"]
+    assert delta.changed == [items[1]["id"]]
+    assert delta.removed == [sold["id"]]
+    assert len(ListingStore(str(tmp_path / "store.db"))) == 300
+
+def test_failed_page_removes_nothing(tmp_path):
+    items = make_items(300)
+    crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    items = copy.deepcopy(items)
+    for item in items[:200]:
+        item["price"] = "1,000 ₪"
+    delta, _, _ = crawl(make_pages(items, 100), str(tmp_path / "store.db"), served_pages=2)
+    assert len(delta.changed) == 200
+    assert delta.removed == []
+    assert len(ListingStore(str(tmp_path / "store.db"))) == 300
+
+def test_listing_removed_past_the_first_known_page(tmp_path, monkeypatch):
+    items = make_items(300)
+    crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    items = copy.deepcopy(items)
+    sold = items.pop(250)
+    # Page 1 is unchanged, so this crawl stops before the page the listing was on
+    delta, _, requests = crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    assert delta.removed == [] and requests == 1
+    # Once the last full crawl is FULL_SCRAPE_INTERVAL old every page is fetched again
+    monkeypatch.setattr(yad2.scraper, "FULL_SCRAPE_INTERVAL", 0)
+    delta, _, requests = crawl(make_pages(items, 100), str(tmp_path / "store.db"))
+    assert delta.removed == [sold["id"]] and requests == 3
+    assert len(ListingStore(str(tmp_path / "store.db"))) == 299
@@ -0,0 +1,81 @@
+import pytest
+
+import yad2.web
+from yad2.schema import LISTING_COLUMNS, SCORE_COLUMNS
+
+COLUMNS = LISTING_COLUMNS + SCORE_COLUMNS
+
+def listings(client, **params):
+    # A DataTables server side request over every column of the page
+    query = {"draw": 3, "manufacturer": "KIA", "start": 0, "length": 10}
+    for i, column in enumerate(COLUMNS):
+        query[f"columns[{i}][data]"] = column
+        query[f"columns[{i}][search][value]"] = params.pop(column, "")
+    if "order" in params:
+        column, direction = params.pop("order")
+        query["order[0][column]"] = COLUMNS.index(column)
+        query["order[0][dir]"] = direction
+    query.update(params)
+    response = client.get("/api/listings", query_string=query)
+    assert response.status_code == 200, response.status_code
+    return response.get_json()
+
+@pytest.fixture
+def client(feed, make_app):
+    return make_app(refresh=False).test_client()
+
+def test_paging(client):
+    first = listings(client)
+    assert first["draw"] == 3
+    assert first["recordsTotal"] == first["recordsFiltered"] == 50
+    assert len(first["data"]) == 10
+    second = listings(client, start=10)
+    assert not {row["ad_id"] for row in first["data"]} & {row["ad_id"] for row in second["data"]}
+    assert len(listings(client, start=45)["data"]) == 5
+    # Images are loaded by the gallery
+    assert "images_urls" not in first["data"][0]
+
+def test_all_rows_are_capped(client, monkeypatch):
+    monkeypatch.setattr(yad2.web, "MAX_PAGE_LENGTH", 20)
+    assert len(listings(client, length=-1)["data"]) == 20
+    assert len(listings(client, length=1000)["data"]) == 20
+
+def test_column_and_global_search(client):
+    every = listings(client, length=-1)["data"]
+    city = every[0]["city"]
+    matching = listings(client, city=city.upper(), length=-1)
+    assert matching["recordsTotal"] == 50
+    assert matching["recordsFiltered"] == sum(row["city"] == city for row in every)
+    assert all(row["city"] == city for row in matching["data"])
+    searched = listings(client, **{"search[value]": every[0]["ad_id"]})
+    assert [row["ad_id"] for row in searched["data"]] == [every[0]["ad_id"]]
+
+@pytest.mark.parametrize("column", ["price", "city", "deal_score"])
+def test_ordering(client, column):
+    ascending = [row[column] for row in listings(client, order=(column, "asc"), length=-1)["data"]]
+    descending = [row[column] for row in listings(client, order=(column, "desc"), length=-1)["data"]]
+    key = (lambda value: float(value)) if column != "city" else str
+    present = [value for value in ascending if value != ""]
+    assert present == sorted(present, key=key)
+    # Missing values last in both directions
+    assert ascending[len(present):] == descending[len(present):] == [""] * (len(ascending) - len(present))
+    assert descending[:len(present)] == sorted(present, key=key, reverse=True)
+
+def test_version_pinning(client):
+    app = client.application
+    state = app.extensions["yad2"]
+    pinned = listings(client)
+    version = state.snapshot_cache.current_version("KIA")
+    df = state.snapshot_cache.get("KIA").df
+    state.registry.publish_frame(state.dataset_keys["KIA"], df.iloc[:5])
+    assert listings(client)["recordsTotal"] == 5
+    assert listings(client, version=version) == pinned
+    # A version that was never published, or could not have been
+    assert client.get("/api/listings", query_string={"manufacturer": "KIA",
+                                                     "version": "20200101T000000000000-00000000"}).status_code == 410
+    assert client.get("/api/listings", query_string={"manufacturer": "KIA", "version": "../x"}).status_code == 410
+
+def test_cells_are_escaped_by_the_page(client):
+    html = client.get("/").data.decode()
+    assert "render: $.fn.dataTable.render.text()" in html
+    assert "var ownRenderers = ['deal_score', 'info_text', 'search_text'];" in html
@@ -0,0 +1,30 @@
+from feeds import make_items
+from yad2.listings import normalize_listings
+from yad2.registry import DatasetRegistry
+from yad2.snapshots import Snapshot
+
+def test_categoricals_of_several_chunks_sort_by_value(tmp_path):
+    items = make_items(3000)
+    for i, item in enumerate(items):
+        item["city"] = "zzz" if i < 2000 else "aaa"
+    registry = DatasetRegistry(str(tmp_path))
+    version = registry.new_version()
+    with registry.sink("key", version) as sink:
+        for start in range(0, len(items), 2000):
+            sink.write(None, normalize_listings(items[start:start + 2000]))
+    registry.publish("key", version)
+
+    df, _ = registry.open("key", version)
+    assert list(df["city"].cat.categories) == ["aaa", "zzz"]
+    snapshot = Snapshot(df, 0, version)
+    cities = df["city"].to_numpy()
+    assert cities[snapshot.sort_order("city")[0]] == "aaa"
+    assert cities[snapshot.sort_order("city", ascending=False)[0]] == "zzz"
+
+def test_versions_are_pruned(tmp_path):
+    registry = DatasetRegistry(str(tmp_path), versions_kept=2)
+    df = normalize_listings(make_items(10))
+    versions = [registry.publish_frame("key", df) for _ in range(4)]
+    assert registry.current_version("key") == versions[-1]
+    assert sorted(path.name for path in (tmp_path / "key").iterdir() if path.is_dir()) == versions[2:]
+    assert len(registry.open("key", versions[-1])[0]) == 10
@@ -0,0 +1,50 @@
+import pandas as pd
+import pyarrow as pa
+
+from feeds import make_items
+from yad2.listings import normalize_listings
+from yad2.schema import LISTING_COLUMNS, SCORE_COLUMNS
+from yad2.scoring import score_listings, score_table
+
+def listings(count=1000):
+    items = make_items(count)
+    items[0]["year"] = ""
+    items[1]["price"] = "לא צוין מחיר"
+    items[2]["price"] = 0
+    return normalize_listings(items)
+
+def test_missing_segment_keys_and_prices_are_not_scored():
+    df = listings()
+    assert df["year"].isna().iat[0]
+    df.loc[3, "model"] = pd.NA
+    scores = score_listings(df)
+    assert list(scores.columns) == SCORE_COLUMNS
+    assert scores.index.equals(df.index)
+    assert scores.iloc[0].isna().all()
+    assert scores.iloc[3].isna().all()
+    # Still priced by its segment, but without a price there is no deal
+    assert pd.notna(scores["expected_price"].iat[1]) and pd.isna(scores["deal_score"].iat[1])
+    assert pd.notna(scores["expected_price"].iat[2]) and pd.isna(scores["deal_score"].iat[2])
+    assert scores["deal_score"].notna().sum() > len(df) // 2
+
+def test_no_segments():
+    df = listings(20)
+    df["year"] = pd.NA
+    assert score_listings(df).isna().all().all()
+    assert score_listings(df.iloc[:0]).empty
+
+def test_expected_price_follows_a_linear_price():
+    df = listings(2000)
+    hand = df["hand"].astype(str).str.extract(r"(\d+)", expand=False).astype(float)
+    df["price"] = (150000 - 0.5 * df["kilometers"].astype(float) - 5000 * hand
+                   + 300 * pd.to_numeric(df["Start Month"])).round().astype("Int64")
+    scores = score_listings(df)
+    scored = scores["expected_price"].notna()
+    assert scored.sum() > len(df) // 2
+    assert (scores["expected_price"][scored] - df["price"][scored]).abs().max() <= 1
+
+def test_score_table_appends_the_score_columns():
+    table = pa.Table.from_pandas(listings()[LISTING_COLUMNS], preserve_index=False)
+    scored = score_table(table)
+    assert scored.column_names == LISTING_COLUMNS + SCORE_COLUMNS
+    assert scored.column("expected_price").null_count >= 1
@@ -0,0 +1,119 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import yad2.scraper
+from feeds import make_items, make_pages
+from stub_server import Fault, StubFeedServer
+from yad2.scraper import CircuitBreaker, Yad2CarScraper
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # Backoff of at most 10ms and a read timeout the stub can exceed
+    monkeypatch.setattr(yad2.scraper, "RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(yad2.scraper, "RETRY_MAX_DELAY", 2)
+    monkeypatch.setattr(yad2.scraper, "REQUEST_TIMEOUT", (1, 0.3))
+
+def item_ids(items):
+    return [item["id"] for item in items]
+
+def test_retry_after_is_honoured():
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(429, {"Retry-After": "1"})]}) as server:
+        start = time.monotonic()
+        data = Yad2CarScraper(server.url, {}).fetch_page(1)
+        assert time.monotonic() - start >= 0.9
+        assert data is not None and server.requests == 2
+
+def test_server_errors_are_retried():
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(503), Fault(502)]}) as server:
+        assert Yad2CarScraper(server.url, {}).fetch_page(1) is not None
+        assert server.requests == 3
+
+def test_timeouts_are_retried():
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(delay=1)]}) as server:
+        assert Yad2CarScraper(server.url, {}).fetch_page(1) is not None
+        assert server.requests == 2
+
+def test_other_request_errors_are_retried():
+    # Redirected to itself until requests gives up with TooManyRedirects
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(302, {"Location": "?page=1"})] * 31}) as server:
+        assert Yad2CarScraper(server.url, {}).fetch_page(1) is not None
+        assert server.requests == 32
+
+def test_client_errors_are_not_retried():
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(404)]}) as server:
+        assert Yad2CarScraper(server.url, {}).fetch_page(1) is None
+        assert server.requests == 1
+
+def test_retries_give_up():
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(500)] * 10}) as server:
+        assert Yad2CarScraper(server.url, {}).fetch_page(1) is None
+        assert server.requests == yad2.scraper.MAX_RETRIES + 1
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.25)
+    # Half open: one request goes through, and a single failure opens the circuit again
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.25)
+    assert breaker.allow()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+
+def test_half_open_circuit_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    breaker.record_failure()
+    time.sleep(0.25)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        allowed = list(executor.map(lambda _: breaker.allow(), range(32)))
+    assert allowed.count(True) == 1
+    breaker.record_success()
+    assert all(breaker.allow() for _ in range(4))
+
+def test_open_circuit_skips_requests():
+    with StubFeedServer(make_pages(make_items(10)), {1: [Fault(500)] * 10}) as server:
+        scraper = Yad2CarScraper(server.url, {}, circuit_breaker=CircuitBreaker(3, 60))
+        assert scraper.fetch_page(1) is None
+        assert server.requests == 3
+        assert scraper.fetch_page(1) is None
+        assert server.requests == 3
+
+def test_parallel_scrape_matches_serial_in_page_order():
+    items = make_items(1000)
+    # Earlier pages answer slower, so that pages complete out of order
+    faults = {page: [Fault(delay=0.05 * (6 - page))] * 2 for page in range(1, 6)}
+    with StubFeedServer(make_pages(items, 100), faults) as server:
+        serial = Yad2CarScraper(server.url, {}, max_workers=1)
+        serial.scrape()
+        parallel = Yad2CarScraper(server.url, {}, max_workers=4)
+        parallel.scrape()
+    assert item_ids(serial.all_items) == item_ids(items)
+    assert item_ids(parallel.all_items) == item_ids(items)
+
+def test_checkpoint_resumes_a_failed_crawl(tmp_path):
+    items = make_items(300)
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    with StubFeedServer(make_pages(items, 100), {3: [Fault(404)]}) as server:
+        scraper = Yad2CarScraper(server.url, {}, checkpoint_dir=checkpoint_dir)
+        scraper.scrape()
+        assert item_ids(scraper.all_items) == item_ids(items[:200])
+        assert sorted(os.listdir(scraper.checkpoint.directory)) == ["page_1.json", "page_2.json"]
+
+        # Only the page that failed is fetched again
+        server.requested_pages.clear()
+        scraper = Yad2CarScraper(server.url, {}, checkpoint_dir=checkpoint_dir)
+        scraper.scrape()
+        assert server.requested_pages == [3]
+        assert item_ids(scraper.all_items) == item_ids(items)
+        # A complete crawl clears its checkpoint
+        assert not os.path.exists(scraper.checkpoint.directory)
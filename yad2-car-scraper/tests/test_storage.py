@@ -0,0 +1,22 @@
+import json
+
+from feeds import make_items
+from yad2.listings import normalize_listings
+from yad2.schema import ITEM_FIELDS, compact_item
+from yad2.storage import JsonLinesSink
+
+def test_json_lines_hold_compact_items(tmp_path):
+    items = make_items(20)
+    for item in items:
+        item["extra"] = "dropped"
+    filename = str(tmp_path / "listings.jsonl")
+    with JsonLinesSink(filename) as sink:
+        # Raw feed items and items of the listing store are written the same way
+        sink.write(items[:10], normalize_listings(items[:10]))
+        compact = [compact_item(item) for item in items[10:]]
+        sink.write(compact, normalize_listings(compact))
+    with open(filename, encoding="utf-8") as jsonl_file:
+        written = [json.loads(line) for line in jsonl_file]
+    assert written == [compact_item(item) for item in items]
+    assert all(set(item) <= set(ITEM_FIELDS) for item in written)
+    assert all([detail["name"] for detail in item["more_details"]] == ["month"] for item in written)
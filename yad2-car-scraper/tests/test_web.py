@@ -0,0 +1,60 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import yad2.web
+
+def test_scheduler_starts_with_the_first_request(feed, make_app):
+    app = make_app()
+    state = app.extensions["yad2"]
+    assert state.scheduler is None
+    try:
+        assert app.test_client().get("/").status_code == 200
+        assert state.scheduler is not None and state.scheduler.is_alive()
+        app.test_client().get("/")
+        assert state.scheduler is not None
+    finally:
+        if state.scheduler:
+            state.scheduler.stop()
+            state.scheduler.join(timeout=30)
+
+def test_no_scheduler_without_refresh(feed, make_app):
+    app = make_app(refresh=False)
+    app.test_client().get("/")
+    assert app.extensions["yad2"].scheduler is None
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    monkeypatch.setattr(yad2.web, "PROFILE_REQUESTS", True)
+    monkeypatch.setattr(yad2.web, "PROFILE_SLOW_SECONDS", 0)
+    monkeypatch.setattr(yad2.web, "PROFILE_DIR", str(tmp_path / "profiles"))
+    return tmp_path / "profiles"
+
+def test_overlapping_requests_are_not_profiled(feed, profiling, make_app):
+    client = make_app(refresh=False).test_client()
+    # As if another request was being profiled
+    with yad2.web.profile_lock:
+        assert client.get("/metrics").status_code == 200
+    assert not profiling.exists()
+    assert client.get("/metrics").status_code == 200
+    assert len(list(profiling.iterdir())) == 1
+    assert not yad2.web.profile_lock.locked()
+
+def test_concurrent_profiled_requests(feed, profiling, make_app):
+    client = make_app(refresh=False).test_client()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(lambda _: client.get("/metrics").status_code, range(32)))
+    assert statuses == [200] * 32
+    assert not yad2.web.profile_lock.locked()
+
+def test_regression_plot_is_saved_when_evicted_from_the_cache(feed, make_app):
+    app = make_app(refresh=False)
+    # Every rendered plot is evicted right away, as under many concurrent regressions
+    app.extensions["yad2"].plot_renderer.images.maxsize = 0
+    client = app.test_client()
+    response = client.post("/linear_regression", data={"manufacturer": "KIA"})
+    assert response.status_code == 200
+    plot_url = re.search(r'src="([^"]+\.png)"', response.data.decode()).group(1)
+    plot = client.get(plot_url)
+    assert plot.status_code == 200 and plot.data.startswith(b"\x89PNG")
@@ -0,0 +1,78 @@
+import os
+
+# Dictionary to store manufacturer and model information
+manufacturers_models = {
+    "Hyundai": {"manufacturer": 21, "model": 10291},
+    "KIA": {"manufacturer": 48, "model": 10720},
+    "Toyota": {"manufacturer": 19, "model": 10238}
+}
+
+# Number of pages fetched in parallel and the maximum requests per second to Yad2
+SCRAPER_MAX_WORKERS = 4
+SCRAPER_RATE_LIMIT = 5
+# Seconds between background refreshes of every manufacturer
+REFRESH_INTERVAL = 30 * 60
+# A dataset crawled less than REFRESH_MIN_AGE seconds ago is not crawled again by another worker
+REFRESH_MIN_AGE = REFRESH_INTERVAL // 2
+# Only fetch the pages that changed since the previous crawl
+INCREMENTAL_SCRAPE = True
+# An incremental crawl fetches every page again when the last full one is FULL_SCRAPE_INTERVAL seconds old,
+# to find the listings removed from pages past the first unchanged one
+FULL_SCRAPE_INTERVAL = 6 * 60 * 60
+# Listings written at a time when the listing store is saved to the datasets
+STREAM_CHUNK_SIZE = 2000
+# (connect, read) timeout in seconds of every request to Yad2
+REQUEST_TIMEOUT = (5, 30)
+# Retries of a failed request, with exponential backoff between RETRY_BACKOFF and RETRY_MAX_DELAY seconds
+MAX_RETRIES = 4
+RETRY_BACKOFF = 1.0
+RETRY_MAX_DELAY = 60
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Consecutive failures that stop all requests for CIRCUIT_RESET_TIMEOUT seconds
+CIRCUIT_FAILURE_THRESHOLD = 8
+CIRCUIT_RESET_TIMEOUT = 120
+# Completed pages of an interrupted crawl are kept here and reused for CHECKPOINT_MAX_AGE seconds
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_MAX_AGE = 60 * 60
+# SQLite database keeping the price of every listing in every crawl
+HISTORY_DB = "yad2_history.db"
+# Versioned snapshots of every dataset shared by all web workers, the newest DATASET_VERSIONS_KEPT are kept
+DATASET_DIR = "datasets"
+DATASET_VERSIONS_KEPT = 3
+# Dataset versions each process keeps open
+SNAPSHOT_CACHE_SIZE = 8
+# Smallest (model, submodel, year) segment whose listings get an expected price and a deal score
+SCORING_MIN_SEGMENT_SIZE = 8
+# Profile every request with cProfile and save the ones slower than PROFILE_SLOW_SECONDS
+PROFILE_REQUESTS = os.environ.get("YAD2_PROFILE_REQUESTS") == "1"
+PROFILE_SLOW_SECONDS = 1.0
+PROFILE_DIR = "profiles"
+
+BASE_URL = "https://gw.yad2.co.il/feed-search-legacy/vehicles/cars"
+
+# Largest page the listings API returns, also used when DataTables asks for all rows
+MAX_PAGE_LENGTH = 1000
+# Number of regression results kept in memory
+REGRESSION_CACHE_SIZE = 128
+# Number of rendered plots kept in memory and how long browsers may reuse them
+PLOT_CACHE_SIZE = 256
+PLOT_MAX_AGE = 24 * 60 * 60
+# Most labelled points and most drawn points in a regression plot
+PLOT_ANNOTATION_BUDGET = 50
+PLOT_MAX_POINTS = 5000
+# Listing images are fetched by at most IMAGE_MAX_WORKERS threads and IMAGE_RATE_LIMIT requests per second,
+# and kept as thumbnails of at most IMAGE_THUMBNAIL_SIZE pixels in IMAGE_CACHE_DIR, up to IMAGE_CACHE_MAX_BYTES
+IMAGE_MAX_WORKERS = 8
+IMAGE_RATE_LIMIT = 20
+IMAGE_TIMEOUT = (5, 15)
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_THUMBNAIL_SIZE = (480, 360)
+# Images of the newest listings fetched in the background after each crawl, 0 only fetches them on demand
+IMAGE_PREFETCH_LIMIT = 5000
+# Thumbnails never change, browsers may keep them for IMAGE_MAX_AGE seconds
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+# Imported in the background after the first request, once the saved datasets are loaded,
+# so that no later request waits for them
+WARM_UP_MODULES = ["pandas", "pyarrow.parquet", "numpy", "matplotlib.figure", "matplotlib.font_manager",
+                   "bidi.algorithm", "openpyxl", "PIL.Image"]
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (BASE_URL, CHECKPOINT_DIR, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, IMAGE_PREFETCH_LIMIT,
+                     INCREMENTAL_SCRAPE, REFRESH_MIN_AGE, SCRAPER_MAX_WORKERS, SCRAPER_RATE_LIMIT, STREAM_CHUNK_SIZE,
+                     manufacturers_models)
+from .images import image_urls
+from .lazy import lazy_import
+from .listings import apply_schema, normalize_listings
+from .schema import LISTING_COLUMNS
+from .scoring import score_listings
+from .scraper import CircuitBreaker, ListingStore, RateLimiter, Yad2CarScraper
+from .storage import JsonLinesSink, ParquetSink, chunked, stream_listings
+
+pd = lazy_import("pandas")
+
+CrawlSpec = namedtuple("CrawlSpec", ["name", "manufacturer", "model", "filters"])
+
+def default_filters(manufacturer):
+    filters = {"year": "2022-2024", "km": "-1-50001"}
+    # delete engineval if model is Toyota
+    if (manufacturer != manufacturers_models["Toyota"]["manufacturer"]):
+        filters["engineval"] = "1598-1598"
+    return filters
+
+def default_specs():
+    return [CrawlSpec(name, ids["manufacturer"], ids["model"], default_filters(ids["manufacturer"]))
+            for name, ids in manufacturers_models.items()]
+
+def build_params(spec):
+    params = {
+        "manufacturer": spec.manufacturer,
+        "model": spec.model,
+        **spec.filters,
+        "max_items_per_page": 2000,
+        "page": 1
+    }
+    return params
+
+def crawl(specs, max_workers=SCRAPER_MAX_WORKERS, rate_limit=SCRAPER_RATE_LIMIT):
+    # All specs are crawled at once, sharing one connection pool, one rate limit,
+    # one circuit breaker and at most max_workers requests in flight
+    session = Yad2CarScraper.create_session(max_workers)
+    rate_limiter = RateLimiter(rate_limit)
+    concurrency = threading.BoundedSemaphore(max_workers)
+    circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+    def crawl_spec(spec):
+        scraper = Yad2CarScraper(BASE_URL, build_params(spec), max_workers=max_workers, session=session,
+                                 rate_limiter=rate_limiter, concurrency=concurrency,
+                                 circuit_breaker=circuit_breaker, checkpoint_dir=CHECKPOINT_DIR)
+        # Raw items are normalized page by page, only the compact frames are kept
+        frames = [normalize_listings(items) for _, items in scraper.iter_pages()]
+        df = pd.concat(frames, ignore_index=True) if frames else normalize_listings([])
+        # A listing that moved to the next page during the crawl is on both pages
+        df = df[df["ad_id"].isna() | ~df["ad_id"].duplicated()].reset_index(drop=True)
+        df.insert(0, "source", spec.name)
+        print(f"Crawled {len(df)} listings for {spec.name}.")
+        return df
+
+    with ThreadPoolExecutor(max_workers=max(len(specs), 1)) as executor:
+        frames = list(executor.map(crawl_spec, specs))
+    df = merge_crawls(frames)
+    return df.join(score_listings(df))
+
+def merge_crawls(frames):
+    if not frames:
+        return apply_schema(pd.DataFrame(columns=["source"] + LISTING_COLUMNS))
+    merged = pd.concat(frames, ignore_index=True)
+    merged["source"] = merged["source"].astype(str)
+    # A listing matched by several specs is kept once, tagged with all of them
+    has_id = merged["ad_id"].notna()
+    sources = merged[has_id].groupby("ad_id", sort=False)["source"].agg(
+        lambda names: ",".join(dict.fromkeys(names)))
+    merged = merged[~has_id | ~merged["ad_id"].duplicated()].reset_index(drop=True)
+    merged.loc[merged["ad_id"].notna(), "source"] = merged["ad_id"].map(sources)
+    merged["source"] = merged["source"].astype("category")
+    return apply_schema(merged)
+
+def manufacturer_params(name):
+    spec = next(spec for spec in default_specs() if spec.name == name)
+    return build_params(spec)
+
+def scrape_manufacturer(name, registry, history=None, images=None):
+    params = manufacturer_params(name)
+    key = registry.dataset_key(params)
+    scraper = Yad2CarScraper(BASE_URL, params, max_workers=SCRAPER_MAX_WORKERS,
+                             rate_limit=SCRAPER_RATE_LIMIT, checkpoint_dir=CHECKPOINT_DIR)
+    store = ListingStore(f"yad2_listings_{name}.db") if INCREMENTAL_SCRAPE else None
+    if store is not None:
+        scraper.scrape_incremental(store)
+    version = registry.new_version()
+    with JsonLinesSink(f"yad2_vehicles_{name}.jsonl") as json_sink, \
+            ParquetSink(dataset_filename(name)) as parquet_sink, \
+            registry.sink(key, version) as arrow_sink:
+        sinks = [json_sink, parquet_sink, arrow_sink]
+        if store is not None:
+            # The listing store holds every listing, it is read back in page sized chunks
+            rows = stream_listings(chunked(store.items(), STREAM_CHUNK_SIZE), sinks)
+        else:
+            rows = scraper.stream_to(sinks)
+        if not rows:
+            raise RuntimeError(f"No listings were found for {name}")
+    registry.publish(key, version)
+    df, crawled_at = registry.open(key, version)
+    if history is not None:
+        try:
+            history.append_snapshot(df, crawled_at, name)
+        except sqlite3.Error as e:
+            print(f"Failed to update the price history: {e}")
+    if images is not None and IMAGE_PREFETCH_LIMIT:
+        # The dataset is ordered newest first
+        images.prefetch_in_background(image_urls(df)[:IMAGE_PREFETCH_LIMIT])
+    return version
+
+def refresh_dataset(name, registry, history=None, images=None):
+    # Every web worker refreshes on its own schedule, a dataset that another worker
+    # crawled while this one waited for the lock, or shortly before, is used as is
+    key = registry.dataset_key(manufacturer_params(name))
+    with registry.lock(key):
+        version = registry.current_version(key)
+        if version is not None and time.time() - registry.updated_at(key, version) < REFRESH_MIN_AGE:
+            return version
+        return scrape_manufacturer(name, registry, history, images)
+
+def dataset_filename(name):
+    return f"yad2_vehicles_{name}.parquet"
+
+def load_specs(filename):
+    # A JSON list of {"name", "manufacturer", "model", "filters"} objects
+    with open(filename, "r", encoding="utf-8") as specs_file:
+        return [CrawlSpec(spec["name"], spec["manufacturer"], spec["model"], spec.get("filters", {}))
+                for spec in json.load(specs_file)]
+
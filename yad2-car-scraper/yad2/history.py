@@ -0,0 +1,106 @@
+import itertools
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+from .lazy import lazy_import
+from .metrics import STAGE_SECONDS
+
+pd = lazy_import("pandas")
+
+class PriceHistory:
+    # Append only SQLite store with one row per listing per crawl
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS price_history (
+            ad_id TEXT NOT NULL,
+            crawled_at INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            model TEXT,
+            submodel TEXT,
+            year INTEGER,
+            price INTEGER,
+            kilometers INTEGER,
+            PRIMARY KEY (ad_id, crawled_at)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS price_history_model ON price_history (model, crawled_at, submodel, price);
+        CREATE TABLE IF NOT EXISTS model_history (
+            model TEXT NOT NULL,
+            submodel TEXT NOT NULL,
+            crawled_at INTEGER NOT NULL,
+            listings INTEGER NOT NULL,
+            median_price REAL,
+            mean_price REAL,
+            median_kilometers REAL,
+            PRIMARY KEY (model, submodel, crawled_at)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.created = False
+
+    def connect(self):
+        connection = sqlite3.connect(self.filename, timeout=30)
+        if not self.created:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+            self.created = True
+        return connection
+
+    @STAGE_SECONDS.labels("history").time()
+    def append_snapshot(self, df, crawled_at, source):
+        crawled_at = int(crawled_at)
+        df = df[df["ad_id"].notna()]
+        sources = df["source"].astype(str) if "source" in df.columns else pd.Series(source, index=df.index)
+        rows = pd.DataFrame({
+            "ad_id": df["ad_id"].astype(str),
+            "crawled_at": crawled_at,
+            "source": sources,
+            "model": df["model"].astype(str),
+            "submodel": df["submodel"].astype(str),
+            "year": df["year"].astype(object),
+            "price": df["price"].astype(object),
+            "kilometers": df["kilometers"].astype(object),
+        })
+        rows = rows.where(rows.notna(), None)
+
+        # Per model aggregates are computed once here so the model history never scans listings.
+        # An empty submodel holds the aggregate over all submodels of the model.
+        priced = df[df["price"].notna()]
+        summaries = []
+        for keys, group in itertools.chain(priced.groupby(["model", "submodel"], observed=True),
+                                           priced.assign(submodel="").groupby(["model", "submodel"], observed=True)):
+            model, submodel = keys
+            summaries.append((str(model), str(submodel), crawled_at, len(group), float(group["price"].median()),
+                              float(group["price"].mean()), float(group["kilometers"].median())))
+
+        with closing(self.connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO price_history VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   rows.itertuples(index=False, name=None))
+            connection.executemany("INSERT OR REPLACE INTO model_history VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   summaries)
+        print(f"Added {len(rows)} listings to the price history.")
+
+    def listing_history(self, ad_id):
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT crawled_at, price, kilometers FROM price_history WHERE ad_id = ? ORDER BY crawled_at",
+                (ad_id,)).fetchall()
+        return [{"crawled_at": datetime.fromtimestamp(crawled_at, timezone.utc).isoformat(),
+                 "price": price, "kilometers": kilometers} for crawled_at, price, kilometers in rows]
+
+    def model_history(self, model, submodel="", days=90, window=7):
+        since = int(time.time() - days * 24 * 60 * 60)
+        with closing(self.connect()) as connection:
+            df = pd.read_sql_query(
+                "SELECT crawled_at, listings, median_price, mean_price, median_kilometers FROM model_history "
+                "WHERE model = ? AND submodel = ? AND crawled_at >= ? ORDER BY crawled_at",
+                connection, params=(model, submodel, since))
+        if df.empty:
+            return []
+        df["crawled_at"] = pd.to_datetime(df["crawled_at"], unit="s", utc=True)
+        rolling = df.set_index("crawled_at")["median_price"].rolling(f"{window}D")
+        df["rolling_median_price"] = rolling.median().to_numpy()
+        df["crawled_at"] = df["crawled_at"].map(lambda crawled_at: crawled_at.isoformat())
+        return df.to_dict(orient="records")
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from .config import IMAGE_MAX_WORKERS, IMAGE_RATE_LIMIT, IMAGE_TIMEOUT
+from .lazy import lazy_import
+from .metrics import STAGE_SECONDS
+from .scraper import RateLimiter, Yad2CarScraper
+
+requests = lazy_import("requests")
+Image = lazy_import("PIL.Image")
+
+IMAGE_HASH_PATTERN = re.compile(r"[0-9a-f]{64}")
+# Served thumbnails get a new modification time at most this often, it orders the eviction
+TOUCH_INTERVAL = 24 * 60 * 60
+# URLs per SQLite query, below the bound parameter limit of old SQLite versions
+LOOKUP_CHUNK_SIZE = 500
+
+def image_urls(df):
+    return [url for urls in df["images_urls"].dropna() for url in json.loads(urls)]
+
+class ImageCache:
+    # Thumbnails are stored under the SHA-256 of their bytes, so identical images share one file,
+    # and an SQLite index maps every source URL to its thumbnail. Once the files grow past max_bytes
+    # the least recently served ones are removed.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS images (
+            url TEXT PRIMARY KEY,
+            hash TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS images_hash ON images (hash);
+    """
+
+    def __init__(self, directory, max_bytes, thumbnail_size):
+        # Absolute, send_file would resolve a relative path against the app root
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.created = False
+        self.size = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30)
+        if not self.created:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+            self.created = True
+        return connection
+
+    def path(self, image_hash):
+        return os.path.join(self.directory, image_hash[:2], f"{image_hash}.jpg")
+
+    def lookup(self, urls):
+        # {url: hash} of the urls that have a thumbnail
+        urls = list(dict.fromkeys(urls))
+        hashes = {}
+        with closing(self.connect()) as connection:
+            for start in range(0, len(urls), LOOKUP_CHUNK_SIZE):
+                chunk = urls[start:start + LOOKUP_CHUNK_SIZE]
+                rows = connection.execute(f"SELECT url, hash FROM images WHERE url IN ({','.join('?' * len(chunk))})",
+                                          chunk)
+                hashes.update(rows)
+        # Another process may have evicted the file before removing its index rows
+        return {url: image_hash for url, image_hash in hashes.items() if os.path.exists(self.path(image_hash))}
+
+    def load(self, image_hash):
+        # Path of a cached thumbnail, None when there is none
+        if not IMAGE_HASH_PATTERN.fullmatch(image_hash):
+            return None
+        path = self.path(image_hash)
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+                os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def thumbnail(self, data):
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(self.thumbnail_size)
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=80, optimize=True)
+        return output.getvalue()
+
+    def store(self, url, data):
+        thumbnail = self.thumbnail(data)
+        image_hash = hashlib.sha256(thumbnail).hexdigest()
+        path = self.path(image_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as image_file:
+                image_file.write(thumbnail)
+            os.replace(tmp_path, path)
+            self.added(len(thumbnail))
+        with closing(self.connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO images VALUES (?, ?)", (url, image_hash))
+        return image_hash
+
+    def files(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                for image_file in os.scandir(entry.path):
+                    if image_file.name.endswith(".jpg"):
+                        stat = image_file.stat()
+                        files.append((stat.st_mtime, stat.st_size, image_file.path))
+        return files
+
+    def added(self, size):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(file_size for _, file_size, _ in self.files())
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # Down to 90% of max_bytes, so that eviction does not run again on the next thumbnail
+        files = sorted(self.files())
+        size = sum(file_size for _, file_size, _ in files)
+        removed = []
+        for _, file_size, path in files:
+            if size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+            removed.append(os.path.basename(path)[:-len(".jpg")])
+        with closing(self.connect()) as connection, connection:
+            connection.executemany("DELETE FROM images WHERE hash = ?", ((image_hash,) for image_hash in removed))
+        self.size = size
+        print(f"Evicted {len(removed)} thumbnails from the image cache.")
+
+class ImagePrefetcher:
+    def __init__(self, cache, max_workers=IMAGE_MAX_WORKERS, rate_limit=IMAGE_RATE_LIMIT):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.session = Yad2CarScraper.create_session(max_workers)
+        self.running = threading.Lock()
+
+    def fetch(self, url):
+        self.rate_limiter.wait()
+        try:
+            response = self.session.get(url, timeout=IMAGE_TIMEOUT)
+            if response.status_code != 200:
+                print(f"Image request failed with status code {response.status_code}: {url}")
+                return None
+            return self.cache.store(url, response.content)
+        except (requests.RequestException, OSError, ValueError, Image.DecompressionBombError, sqlite3.Error) as e:
+            print(f"Failed to fetch image {url}: {e}")
+            return None
+
+    def fetch_all(self, urls):
+        # {url: hash} of every url that has a thumbnail, the missing ones are fetched first
+        hashes = self.cache.lookup(urls)
+        missing = [url for url in dict.fromkeys(urls) if url not in hashes]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                for url, image_hash in zip(missing, executor.map(self.fetch, missing)):
+                    if image_hash:
+                        hashes[url] = image_hash
+        return hashes
+
+    @STAGE_SECONDS.labels("image_prefetch").time()
+    def prefetch(self, urls):
+        urls = list(dict.fromkeys(urls))
+        hashes = self.fetch_all(urls)
+        print(f"{len(hashes)} of {len(urls)} listing images are cached.")
+
+    def prefetch_in_background(self, urls):
+        # Skipped while an earlier prefetch still runs, the next crawl picks up what it missed
+        if not self.running.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.prefetch(urls)
+            finally:
+                self.running.release()
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,16 @@
+import importlib
+
+class LazyModule:
+    # Stands in for a module and imports it on the first attribute access,
+    # so that processes which never touch pandas or matplotlib never pay for them
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+def lazy_import(name):
+    return LazyModule(name)
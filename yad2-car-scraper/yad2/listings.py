@@ -0,0 +1,55 @@
+import json
+
+from .lazy import lazy_import
+from .metrics import STAGE_SECONDS
+from .schema import (DATE_COLUMNS, LISTING_DTYPES, LISTING_FIELDS, MORE_DETAILS_COLUMNS, listing_key,
+                     unique_items)
+
+pd = lazy_import("pandas")
+
+def parse_number(series):
+    # Arrow backed strings keep the regex replace in native code
+    digits = series.astype(str).astype("string[pyarrow]").str.replace(r"[,\s₪]", "", regex=True)
+    return pd.to_numeric(digits, errors="coerce").astype("Int64")
+
+@STAGE_SECONDS.labels("normalize").time()
+def normalize_listings(items):
+    items = unique_items(items)
+    df = pd.DataFrame({column: [item.get(field, default) for item in items]
+                       for column, field, default in LISTING_FIELDS})
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    df["images_urls"] = [encode(urls) if isinstance(urls, list) else '[]'
+                         for urls in (item.get("images_urls") for item in items)]
+
+    details = pd.DataFrame(
+        [(row, detail.get("name"), detail.get("value"))
+         for row, item in enumerate(items) for detail in item.get("more_details") or []],
+        columns=["row", "name", "value"])
+    details = details[details["name"].isin(list(MORE_DETAILS_COLUMNS))]
+    # The last value wins when a detail appears more than once
+    details = details.drop_duplicates(subset=["row", "name"], keep="last")
+    details = details.pivot(index="row", columns="name", values="value").rename(columns=MORE_DETAILS_COLUMNS)
+    for column in MORE_DETAILS_COLUMNS.values():
+        df[column] = details[column] if column in details.columns else pd.NA
+
+    df["ad_id"] = [listing_key(item) for item in items]
+
+    for column in ["kilometers", "price", "year"]:
+        df[column] = parse_number(df[column])
+
+    keep = pd.Series(True, index=df.index)
+    for column in ["model", "submodel", "city"]:
+        keep &= df[column].astype("string[pyarrow]").str.strip().fillna("") != ""
+    return apply_schema(df[keep].reset_index(drop=True))
+
+def apply_schema(df):
+    for column, dtype in LISTING_DTYPES.items():
+        if column not in df.columns:
+            df[column] = pd.NA
+        if dtype == "Int64":
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+        else:
+            df[column] = df[column].astype(dtype)
+    for column in DATE_COLUMNS:
+        df[column] = pd.to_datetime(df[column], errors="coerce")
+    return df
@@ -0,0 +1,7 @@
+from prometheus_client import Counter, Histogram
+
+FETCH_SECONDS = Histogram("yad2_fetch_seconds", "Latency of requests to the Yad2 feed", ["status"])
+FETCH_BYTES = Counter("yad2_fetch_bytes", "Bytes received from the Yad2 feed")
+STAGE_SECONDS = Histogram("yad2_stage_seconds", "Time spent in each processing stage", ["stage"],
+                          buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+HTTP_REQUEST_SECONDS = Histogram("yad2_http_request_seconds", "Latency of the web interface", ["endpoint", "status"])
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .config import DATASET_VERSIONS_KEPT
+from .lazy import lazy_import
+from .storage import ArrowSink
+
+pa = lazy_import("pyarrow")
+pd = lazy_import("pandas")
+
+VERSION_PATTERN = re.compile(r"\d{8}T\d{12}-[0-9a-f]{8}")
+PLOT_KEY_PATTERN = re.compile(r"[0-9a-f]{40}")
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, refreshes are then only single flight within one process
+    fcntl = None
+
+class DatasetRegistry:
+    # Every crawl of a dataset is published as a new version that is never modified afterwards:
+    # <directory>/<key>/<version>/listings.arrow, with <directory>/<key>/CURRENT naming the newest one
+    def __init__(self, directory, versions_kept=DATASET_VERSIONS_KEPT):
+        self.directory = directory
+        self.versions_kept = versions_kept
+
+    @staticmethod
+    def dataset_key(params):
+        params = {k: v for k, v in params.items() if k != "page"}
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return f"{params.get('manufacturer')}-{params.get('model')}-{digest[:12]}"
+
+    def dataset_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def version_dir(self, key, version):
+        # Versions come from request parameters, only ones this registry could have created are accepted
+        if not VERSION_PATTERN.fullmatch(version):
+            raise ValueError(f"Invalid dataset version {version!r}")
+        return os.path.join(self.directory, key, version)
+
+    def listings_filename(self, key, version):
+        return os.path.join(self.version_dir(key, version), "listings.arrow")
+
+    def plot_filename(self, key, version, plot_key):
+        return os.path.join(self.version_dir(key, version), "plots", f"{plot_key}.png")
+
+    def current_version(self, key):
+        try:
+            with open(os.path.join(self.dataset_dir(key), "CURRENT"), "r", encoding="utf-8") as current_file:
+                return current_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def updated_at(self, key, version):
+        return os.path.getmtime(self.listings_filename(key, version))
+
+    def new_version(self):
+        # Sorts by creation time, the random suffix keeps concurrent writers apart
+        return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(4)}"
+
+    def sink(self, key, version):
+        os.makedirs(self.version_dir(key, version), exist_ok=True)
+        return ArrowSink(self.listings_filename(key, version))
+
+    def publish(self, key, version):
+        # Readers follow CURRENT, so a version becomes visible only once it is completely written
+        current = os.path.join(self.dataset_dir(key), "CURRENT")
+        tmp_filename = f"{current}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as current_file:
+            current_file.write(version)
+        os.replace(tmp_filename, current)
+        self.prune(key, version)
+
+    def publish_frame(self, key, df):
+        version = self.new_version()
+        with self.sink(key, version) as sink:
+            sink.write(None, df)
+        self.publish(key, version)
+        return version
+
+    def prune(self, key, current):
+        versions = sorted(name for name in os.listdir(self.dataset_dir(key))
+                          if VERSION_PATTERN.fullmatch(name) and name != current)
+        # Processes still holding a removed version keep their mapping of it
+        for version in versions[:max(len(versions) - self.versions_kept + 1, 0)]:
+            shutil.rmtree(self.version_dir(key, version), ignore_errors=True)
+
+    def open(self, key, version):
+        filename = self.listings_filename(key, version)
+        # The pages of the file are shared by every process that maps it, strings stay in the mapped buffers
+        table = pa.ipc.open_file(pa.memory_map(filename)).read_all()
+        # The score columns are not in the pandas metadata, their nullable dtypes are restored here
+        df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow"), pa.int64(): pd.Int64Dtype(),
+                                           pa.float64(): pd.Float64Dtype()}.get)
+        # The unified dictionaries are in order of first appearance, categoricals sort by their categories
+        for column in df.select_dtypes("category").columns:
+            df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+        return df, os.path.getmtime(filename)
+
+    def load_plot(self, key, version, plot_key):
+        if not (VERSION_PATTERN.fullmatch(version) and PLOT_KEY_PATTERN.fullmatch(plot_key)):
+            return None
+        try:
+            with open(self.plot_filename(key, version, plot_key), "rb") as plot_file:
+                return plot_file.read()
+        except FileNotFoundError:
+            return None
+
+    def save_plot(self, key, version, plot_key, image):
+        filename = self.plot_filename(key, version, plot_key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filename, "wb") as plot_file:
+            plot_file.write(image)
+        os.replace(tmp_filename, filename)
+
+    @contextmanager
+    def lock(self, key):
+        # Held while a dataset is crawled, so that only one process crawls it at a time
+        os.makedirs(self.dataset_dir(key), exist_ok=True)
+        with open(os.path.join(self.dataset_dir(key), "lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
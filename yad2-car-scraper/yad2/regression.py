@@ -0,0 +1,94 @@
+import hashlib
+import io
+import json
+from collections import namedtuple
+
+from .cache import LRUCache
+from .lazy import lazy_import
+from .metrics import STAGE_SECONDS
+
+np = lazy_import("numpy")
+mpl_figure = lazy_import("matplotlib.figure")
+font_manager = lazy_import("matplotlib.font_manager")
+bidi = lazy_import("bidi.algorithm")
+
+RegressionResult = namedtuple("RegressionResult", ["slope", "intercept", "count", "plot_key"])
+
+def regression_filters(form, columns):
+    # Normalized so that the same filters always map to the same cache key
+    return tuple(sorted((column, value.lower()) for column, value in form.items()
+                        if column in columns and value))
+
+@STAGE_SECONDS.labels("regression_fit").time()
+def fit_line(x, y):
+    # Closed form least squares for y = slope * x + intercept
+    x_mean = x.mean()
+    y_mean = y.mean()
+    x_centered = x - x_mean
+    variance = np.dot(x_centered, x_centered)
+    slope = np.dot(x_centered, y - y_mean) / variance if variance else 0.0
+    return slope, y_mean - slope * x_mean
+
+class PlotRenderer:
+    def __init__(self, cache_size, annotation_budget, max_points):
+        self.images = LRUCache(cache_size)
+        self.annotation_budget = annotation_budget
+        self.max_points = max_points
+
+    def get(self, key):
+        return self.images.get(key)
+
+    @STAGE_SECONDS.labels("plot_render").time()
+    def render(self, key, x, y, labels, slope, intercept):
+        # Uses its own Figure instead of the global pyplot state, so requests can render in parallel
+        figure = mpl_figure.Figure(figsize=(10, 6))
+        ax = figure.subplots()
+        points = np.arange(len(x))
+        if len(points) > self.max_points:
+            points = np.sort(np.random.default_rng(0).choice(points, self.max_points, replace=False))
+        ax.scatter(x[points], y[points], color='blue', label='Data points')
+        line_x = np.array([x.min(), x.max()])
+        ax.plot(line_x, slope * line_x + intercept, color='red', linewidth=2, label='Linear regression line')
+        ax.set_xlabel('Price')
+        ax.set_ylabel('Kilometers')
+        ax.set_title('Linear Regression: Kilometers vs Price')
+        ax.legend()
+
+        # Only the points furthest from the line get a label
+        annotated = points
+        if len(annotated) > self.annotation_budget:
+            distance = np.abs(y[points] - (slope * x[points] + intercept))
+            annotated = points[np.argpartition(distance, -self.annotation_budget)[-self.annotation_budget:]]
+        # Set font properties for Hebrew characters
+        font = font_manager.FontProperties(family='Arial')
+        for i in annotated:
+            # Correct the direction of mixed Hebrew and English text
+            ax.annotate(bidi.get_display(labels[i]), (x[i], y[i]), fontproperties=font)
+
+        img = io.BytesIO()
+        figure.savefig(img, format='png')
+        image = img.getvalue()
+        self.images.put(key, image)
+        return image
+
+def plot_key(manufacturer, version, filters):
+    return hashlib.sha1(json.dumps([manufacturer, version, filters], ensure_ascii=False).encode()).hexdigest()
+
+def compute_regression(manufacturer, snapshot, filters, plot_renderer):
+    # (result, plot image), the image is None when no listing matches the filters
+    df = snapshot.df
+    mask = snapshot.filter(dict(filters)) & df['price'].notna().to_numpy() & df['kilometers'].notna().to_numpy()
+    filtered_df = df[mask]
+    if filtered_df.empty:
+        return RegressionResult(0.0, 0.0, 0, None), None
+
+    x = filtered_df['price'].to_numpy(dtype=float)
+    y = filtered_df['kilometers'].to_numpy(dtype=float)
+    slope, intercept = fit_line(x, y)
+
+    labels = (filtered_df['submodel'].astype(str) + ", " + filtered_df['city'].astype(str) + ", "
+              + filtered_df['year'].astype(str)).to_numpy()
+    key = plot_key(manufacturer, snapshot.version, filters)
+    image = plot_renderer.render(key, x, y, labels, slope, intercept)
+    return RegressionResult(slope, intercept, len(filtered_df), key), image
+
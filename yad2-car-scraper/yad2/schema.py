@@ -0,0 +1,99 @@
+import json
+import sys
+
+# Fields compared to decide whether a known listing changed since the last crawl
+FINGERPRINT_FIELDS = ["price", "kilometers", "date", "Hand_text", "city", "info_text", "images_urls"]
+
+# Column types of the listings table, dates are parsed separately
+LISTING_DTYPES = {
+    "company": "category",
+    "city": "category",
+    "model": "category",
+    "submodel": "category",
+    "year": "Int64",
+    "hand": "category",
+    "kilometers": "Int64",
+    "price": "Int64",
+    "contact_name": "string",
+    "info_text": "string",
+    "search_text": "string",
+    "OwnerID_text": "category",
+    "pricelist_link_url": "string",
+    "images_urls": "string",
+    "Start Month": "string",
+    "ad_id": "string",
+}
+DATE_COLUMNS = ["date", "date_added"]
+# Columns added by the scoring of a whole dataset, after the listing columns
+SCORE_DTYPES = {
+    "expected_price": "Int64",
+    "deal_score": "Float64",
+}
+SCORE_COLUMNS = list(SCORE_DTYPES)
+
+# (column, feed item field, default) in the order the columns are written
+LISTING_FIELDS = [
+    ("company", "line_2", "טרייד מוביל"),
+    ("city", "city", ""),
+    ("model", "row_1", ""),
+    ("submodel", "row_2", ""),
+    ("year", "year", 0),
+    ("hand", "Hand_text", ""),
+    ("kilometers", "kilometers", 0),
+    ("price", "price", 0),
+    ("contact_name", "contact_name", ""),
+    ("info_text", "info_text", ""),
+    ("search_text", "search_text", ""),
+    ("date", "date", ""),
+    ("date_added", "date_added", ""),
+    ("OwnerID_text", "OwnerID_text", ""),
+    ("pricelist_link_url", "pricelist_link_url", ""),
+]
+# more_details entries pulled into their own column
+MORE_DETAILS_COLUMNS = {"month": "Start Month"}
+LISTING_COLUMNS = ([column for column, _, _ in LISTING_FIELDS] + ["images_urls"] + list(MORE_DETAILS_COLUMNS.values())
+                   + ["ad_id"])
+
+# Raw item fields the pipeline reads, everything else in a feed item is dropped once it is crawled
+ITEM_FIELDS = list(dict.fromkeys([field for _, field, _ in LISTING_FIELDS] + FINGERPRINT_FIELDS
+                                 + ["images_urls", "more_details", "id", "link_token", "ad_number"]))
+# Few distinct values repeated in every listing, one string object per value is kept
+INTERNED_FIELDS = {field for column, field, _ in LISTING_FIELDS if LISTING_DTYPES.get(column) == "category"}
+
+def feed_items(data):
+    return data.get("data", {}).get("feed", {}).get("feed_items", [])
+
+def listing_key(item):
+    key = item.get("id") or item.get("link_token") or item.get("ad_number")
+    return str(key) if key else None
+
+def listing_fingerprint(item):
+    return json.dumps([item.get(field) for field in FINGERPRINT_FIELDS], sort_keys=True, ensure_ascii=False)
+
+def compact_item(item):
+    compact = {}
+    for field in ITEM_FIELDS:
+        if field not in item:
+            continue
+        value = item[field]
+        if field in INTERNED_FIELDS and isinstance(value, str):
+            value = sys.intern(value)
+        compact[field] = value
+    if compact.get("more_details"):
+        compact["more_details"] = [detail for detail in compact["more_details"]
+                                   if isinstance(detail, dict) and detail.get("name") in MORE_DETAILS_COLUMNS]
+    return compact
+
+def unique_items(items):
+    # The first item of every listing key, items without a key are compared on their listing fields.
+    # One pass over a dict, no column of the listings is hashed or serialized.
+    seen = set()
+    unique = []
+    for item in items:
+        key = listing_key(item)
+        if key is None:
+            key = tuple(item.get(field) for _, field, _ in LISTING_FIELDS)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
@@ -0,0 +1,90 @@
+from .config import SCORING_MIN_SEGMENT_SIZE
+from .lazy import lazy_import
+from .metrics import STAGE_SECONDS
+from .schema import SCORE_COLUMNS, SCORE_DTYPES
+
+np = lazy_import("numpy")
+pa = lazy_import("pyarrow")
+pd = lazy_import("pandas")
+
+# Listings are compared within their segment, the year of the segment takes the place of an age term
+SEGMENT_COLUMNS = ["model", "submodel", "year"]
+SCORING_COLUMNS = SEGMENT_COLUMNS + ["price", "kilometers", "hand", "Start Month"]
+
+def segment_sums(codes, values, segments):
+    # Per segment sums of every column of values, one bincount per column
+    values = values.reshape(len(values), -1)
+    sums = [np.bincount(codes, weights=values[:, i], minlength=segments) for i in range(values.shape[1])]
+    return np.stack(sums, axis=1) if sums else np.zeros((segments, 0))
+
+def features(df):
+    # Kilometers, hand and month the car went on the road, NaN when missing
+    hand = df["hand"].astype("string[pyarrow]").str.extract(r"(\d+)", expand=False)
+    return np.column_stack([
+        pd.to_numeric(df["kilometers"], errors="coerce").to_numpy(dtype=float, na_value=np.nan),
+        pd.to_numeric(hand, errors="coerce").to_numpy(dtype=float, na_value=np.nan),
+        pd.to_numeric(df["Start Month"], errors="coerce").to_numpy(dtype=float, na_value=np.nan),
+    ])
+
+@STAGE_SECONDS.labels("scoring").time()
+def score_listings(df):
+    # Least squares fit of price on the features for every segment at once, from the summed normal
+    # equations of all segments. expected_price is the fitted price, deal_score the share of it the
+    # listing is cheaper by, negative when it is more expensive.
+    scores = pd.DataFrame({column: pd.Series(pd.NA, index=df.index, dtype=dtype)
+                           for column, dtype in SCORE_DTYPES.items()})
+    if df.empty:
+        return scores
+    # Listings with a missing model, submodel or year are in no segment, ngroup gives them NaN
+    codes = (df.groupby(SEGMENT_COLUMNS, observed=True, sort=False, dropna=True).ngroup()
+             .fillna(-1).to_numpy(dtype=np.int64))
+    segments = codes.max() + 1
+    if segments <= 0:
+        return scores
+    x = features(df)
+    price = pd.to_numeric(df["price"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+    fit = (codes >= 0) & ~np.isnan(price) & (price > 0)
+    fit_codes = codes[fit]
+    fit_x = x[fit]
+    fit_price = price[fit]
+    present = ~np.isnan(fit_x)
+    sizes = np.bincount(fit_codes, minlength=segments)
+    x_mean = segment_sums(fit_codes, np.where(present, fit_x, 0), segments) / np.maximum(
+        segment_sums(fit_codes, present.astype(float), segments), 1)
+    price_mean = np.bincount(fit_codes, weights=fit_price, minlength=segments) / np.maximum(sizes, 1)
+
+    # Centered on the segment means, a missing feature then adds nothing to the fit or the prediction
+    centered = np.where(present, fit_x - x_mean[fit_codes], 0)
+    centered_price = fit_price - price_mean[fit_codes]
+    k = x.shape[1]
+    xtx = segment_sums(fit_codes, centered[:, :, None] * centered[:, None, :], segments).reshape(segments, k, k)
+    xty = segment_sums(fit_codes, centered * centered_price[:, None], segments)
+    # The pseudo inverse leaves out features that do not vary within a segment
+    coefficients = np.einsum("sij,sj->si", np.linalg.pinv(xtx, rcond=1e-10), xty)
+
+    scored = (codes >= 0) & (sizes[np.maximum(codes, 0)] >= SCORING_MIN_SEGMENT_SIZE)
+    rows = np.flatnonzero(scored)
+    row_codes = codes[rows]
+    row_x = x[rows]
+    row_centered = np.where(np.isnan(row_x), 0, row_x - x_mean[row_codes])
+    expected = price_mean[row_codes] + (row_centered * coefficients[row_codes]).sum(axis=1)
+    expected = np.where(expected > 0, np.round(expected), np.nan)
+    # Listings without a price, or with a placeholder of 0, get no deal score
+    row_price = np.where(price[rows] > 0, price[rows], np.nan)
+    deal_score = np.round((expected - row_price) / expected, 4)
+
+    expected_price = np.full(len(df), np.nan)
+    expected_price[rows] = expected
+    deal_scores = np.full(len(df), np.nan)
+    deal_scores[rows] = deal_score
+    scores["expected_price"] = pd.array(expected_price, dtype="Float64").astype("Int64")
+    scores["deal_score"] = pd.array(deal_scores, dtype="Float64")
+    return scores
+
+def score_table(table):
+    # The scores of an Arrow table of listings, appended as columns
+    scores = score_listings(table.select(SCORING_COLUMNS).to_pandas())
+    for column in SCORE_COLUMNS:
+        table = table.append_column(column, pa.Array.from_pandas(scores[column]))
+    return table
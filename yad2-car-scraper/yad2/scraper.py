@@ -0,0 +1,448 @@
+import email.utils
+import hashlib
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timezone
+
+from .config import (CHECKPOINT_MAX_AGE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, FULL_SCRAPE_INTERVAL,
+                     MAX_RETRIES, REQUEST_TIMEOUT, RETRY_BACKOFF, RETRY_MAX_DELAY, RETRY_STATUS_CODES,
+                     STREAM_CHUNK_SIZE)
+from .lazy import lazy_import
+from .listings import normalize_listings
+from .metrics import FETCH_BYTES, FETCH_SECONDS
+from .schema import compact_item, feed_items, listing_fingerprint, listing_key
+from .storage import ExcelSink, ParquetSink, chunked, stream_listings, write_excel
+
+requests = lazy_import("requests")
+
+# Keys per SQLite query, below the bound parameter limit of old SQLite versions
+LOOKUP_CHUNK_SIZE = 500
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+ScrapeDelta = namedtuple("ScrapeDelta", ["added", "changed", "removed", "pages_fetched"])
+
+class ListingStore:
+    # SQLite table with the newest version of every listing. Crawls update it page by page and read it back
+    # in feed order, so no crawl holds all listings in memory. crawl is the last crawl that saw a listing.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS listings (
+            key TEXT PRIMARY KEY,
+            date TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            crawl INTEGER NOT NULL,
+            item TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS listings_date ON listings (date);
+        CREATE TABLE IF NOT EXISTS store_state (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL
+        );
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.created = False
+
+    def connect(self):
+        connection = sqlite3.connect(self.filename, timeout=30)
+        if not self.created:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+            self.created = True
+        return connection
+
+    def new_crawl(self):
+        with closing(self.connect()) as connection:
+            return connection.execute("SELECT COALESCE(MAX(crawl), 0) + 1 FROM listings").fetchone()[0]
+
+    def fingerprints(self, keys):
+        # {key: fingerprint} of the known keys
+        keys = list(keys)
+        fingerprints = {}
+        with closing(self.connect()) as connection:
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                fingerprints.update(connection.execute(
+                    f"SELECT key, fingerprint FROM listings WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+        return fingerprints
+
+    def update(self, items, crawl):
+        # items maps keys to compact items
+        rows = [(key, item.get("date") or "", listing_fingerprint(item), crawl,
+                 json.dumps(item, ensure_ascii=False)) for key, item in items.items()]
+        with closing(self.connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)", rows)
+
+    def sweep(self, crawl, newer_than=None):
+        # Removes the listings the crawl did not see, only those dated after newer_than when it is given
+        condition = "crawl != ?" + (" AND date > ?" if newer_than is not None else "")
+        params = (crawl,) if newer_than is None else (crawl, newer_than)
+        with closing(self.connect()) as connection, connection:
+            removed = [key for key, in connection.execute(f"SELECT key FROM listings WHERE {condition}", params)]
+            connection.execute(f"DELETE FROM listings WHERE {condition}", params)
+        return removed
+
+    def reconciled_at(self):
+        # Time of the last complete crawl of every page, 0 when there was none
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT value FROM store_state WHERE name = 'reconciled_at'").fetchone()
+        return row[0] if row else 0
+
+    def set_reconciled_at(self, timestamp):
+        with closing(self.connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO store_state VALUES ('reconciled_at', ?)", (timestamp,))
+
+    def __len__(self):
+        with closing(self.connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def items(self):
+        # Newest first like the feed, read lazily
+        with closing(self.connect()) as connection:
+            for item, in connection.execute("SELECT item FROM listings ORDER BY date DESC, key"):
+                yield json.loads(item)
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half open: a single probe request goes through, the others wait until it succeeds.
+            # The timeout starts again, so a probe that never reports back is followed by another one.
+            self.opened_at = time.monotonic()
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing:
+                # The probe failed, pause again
+                self.probing = False
+                self.opened_at = time.monotonic()
+            elif self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                print(f"Too many failed requests, pausing requests for {self.reset_timeout} seconds.")
+
+class PageCheckpoint:
+    # Pages of one crawl saved as JSON files, so that an interrupted crawl can resume
+    def __init__(self, directory, base_url, params, max_age=CHECKPOINT_MAX_AGE):
+        key = json.dumps([base_url, {k: v for k, v in params.items() if k != "page"}], sort_keys=True)
+        self.directory = os.path.join(directory, hashlib.sha1(key.encode()).hexdigest())
+        self.max_age = max_age
+        os.makedirs(self.directory, exist_ok=True)
+
+    def page_filename(self, page_number):
+        return os.path.join(self.directory, f"page_{page_number}.json")
+
+    def load(self, page_number):
+        filename = self.page_filename(page_number)
+        try:
+            if time.time() - os.path.getmtime(filename) > self.max_age:
+                return None
+            with open(filename, "r", encoding="utf-8") as page_file:
+                return json.load(page_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, page_number, data):
+        filename = self.page_filename(page_number)
+        with open(filename + ".tmp", "w", encoding="utf-8") as page_file:
+            json.dump(data, page_file, ensure_ascii=False)
+        os.replace(filename + ".tmp", filename)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BACKOFF * 2 ** attempt))
+
+def retry_after_delay(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        delay = float(value)
+    else:
+        try:
+            delay = (email.utils.parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0), RETRY_MAX_DELAY)
+
+class Yad2CarScraper:
+    def __init__(self, base_url, params, max_workers=1, rate_limit=None, session=None,
+                 rate_limiter=None, concurrency=None, circuit_breaker=None, checkpoint_dir=None):
+        self.base_url = base_url
+        self.params = params
+        self.all_items = []
+        # max_workers pages are fetched in parallel once pagination is known,
+        # rate_limit caps the requests per second across all workers.
+        # Scrapers sharing a rate_limiter and a concurrency semaphore share one budget.
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter or RateLimiter(rate_limit)
+        self.concurrency = concurrency
+        self.session = session or self.create_session(max_workers)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        self.checkpoint = PageCheckpoint(checkpoint_dir, base_url, params) if checkpoint_dir else None
+
+    @staticmethod
+    def create_session(pool_size=1):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, params):
+        if self.concurrency:
+            with self.concurrency:
+                self.rate_limiter.wait()
+                return self.timed_get(params)
+        self.rate_limiter.wait()
+        return self.timed_get(params)
+
+    def timed_get(self, params):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=REQUEST_TIMEOUT)
+            status = str(response.status_code)
+            FETCH_BYTES.inc(len(response.content))
+            return response
+        finally:
+            FETCH_SECONDS.labels(status).observe(time.perf_counter() - start)
+
+    def fetch_page(self, page_number):
+        if self.checkpoint:
+            data = self.checkpoint.load(page_number)
+            if data is not None:
+                print(f"Loaded page {page_number} from checkpoint.")
+                return data
+
+        params = dict(self.params, page=page_number)
+        data = self.request_with_retries(params)
+        if data is not None and self.checkpoint:
+            self.checkpoint.save(page_number, data)
+        return data
+
+    def request_with_retries(self, params):
+        for attempt in range(MAX_RETRIES + 1):
+            if not self.circuit_breaker.allow():
+                print(f"Skipping page {params['page']}, requests are paused after repeated failures.")
+                return None
+            delay = None
+            try:
+                response = self.get(params)
+                if response.status_code == 200:
+                    data = response.json()
+                    self.circuit_breaker.record_success()
+                    return data
+                print(f"Request failed with status code {response.status_code}")
+                if response.status_code not in RETRY_STATUS_CODES:
+                    # Yad2 answered, the circuit has no reason to stay open
+                    self.circuit_breaker.record_success()
+                    return None
+                delay = retry_after_delay(response)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Request for page {params['page']} failed: {e}")
+            self.circuit_breaker.record_failure()
+            if attempt < MAX_RETRIES:
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                print(f"Retrying page {params['page']} in {delay:.1f} seconds.")
+                time.sleep(delay)
+        print(f"Giving up on page {params['page']} after {MAX_RETRIES + 1} attempts.")
+        return None
+
+    def iter_fetch(self, page_numbers):
+        # Yields (page_number, data) in page order with at most max_workers pages in flight
+        if self.max_workers <= 1:
+            for page_number in page_numbers:
+                yield page_number, self.fetch_page(page_number)
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for page_number in page_numbers:
+                pending.append((page_number, executor.submit(self.fetch_page, page_number)))
+                if len(pending) >= self.max_workers:
+                    page_number, future = pending.popleft()
+                    yield page_number, future.result()
+            while pending:
+                page_number, future = pending.popleft()
+                yield page_number, future.result()
+
+    def fetch_pages(self, page_numbers):
+        return [data for _, data in self.iter_fetch(page_numbers)]
+
+    def iter_pages(self):
+        data = self.fetch_page(1)
+        if data:
+            data_page = data['data']
+            pagination = data_page.get("pagination", {})
+            current_page = pagination.get("current_page", 1)
+            last_page = pagination.get("last_page", 1)
+            items_per_page = pagination.get("max_items_per_page", 40)
+            total_items = pagination.get("total_items", 0)
+            
+            print(f"Current Page: {current_page}")
+            print(f"Last Page: {last_page}")
+            print(f"Items per Page: {items_per_page}")
+            print(f"Total Items: {total_items}")
+            
+            yield 1, feed_items(data)
+
+            complete = True
+            for page_number, data in self.iter_fetch(range(2, last_page + 1)):
+                if data:
+                    items = feed_items(data)
+                    print(f"Processed page {page_number} with {len(items)} items.")
+                    yield page_number, items
+                else:
+                    complete = False
+                    print(f"No data found on page {page_number}.")
+            # Keep the checkpoint of an incomplete crawl so the next run only fetches the missing pages
+            if complete and self.checkpoint:
+                self.checkpoint.clear()
+        else:
+            print("Failed to retrieve data from the first page.")
+
+    def scrape(self):
+        self.all_items = []  # Clear previous items
+        for _, items in self.iter_pages():
+            self.all_items.extend(compact_item(item) for item in items)
+
+    def stream_to(self, sinks):
+        # Only one page of raw items is held in memory at a time
+        return stream_listings((items for _, items in self.iter_pages()), sinks)
+
+    def scrape_incremental(self, store):
+        # The feed is ordered by date, so once a whole page holds known and unchanged
+        # listings the remaining pages only hold listings we already have.
+        # Every page is written to the store as it arrives, read the listings back with store.items().
+        data = self.fetch_page(1)
+        if not data:
+            print("Failed to retrieve data from the first page.")
+            return None
+        last_page = data['data'].get("pagination", {}).get("last_page", 1)
+
+        # Stopping early never removes listings from the later pages, so now and then every page is fetched
+        full_crawl = time.time() - store.reconciled_at() >= FULL_SCRAPE_INTERVAL
+        crawl = store.new_crawl()
+        oldest_date = None
+        added, changed = [], []
+        pages = [(1, data)]
+        next_page = 2
+        pages_fetched = 1
+        reached_known = False
+        complete = True
+        while True:
+            for page_number, data in pages:
+                if not data:
+                    complete = False
+                    print(f"No data found on page {page_number}.")
+                    continue
+                page_items = {}
+                for item in feed_items(data):
+                    key = listing_key(item)
+                    if key is not None:
+                        page_items[key] = compact_item(item)
+                known = store.fingerprints(page_items)
+                page_updates = 0
+                for key, item in page_items.items():
+                    if key not in known:
+                        added.append(key)
+                        page_updates += 1
+                    elif known[key] != listing_fingerprint(item):
+                        changed.append(key)
+                        page_updates += 1
+                    date = item.get("date") or ""
+                    oldest_date = date if oldest_date is None else min(oldest_date, date)
+                store.update(page_items, crawl)
+                if page_items and not page_updates and not full_crawl:
+                    reached_known = True
+            if reached_known or next_page > last_page:
+                break
+            # Fetch the next batch of pages, as many as there are workers
+            page_numbers = range(next_page, min(next_page + self.max_workers, last_page + 1))
+            pages = list(zip(page_numbers, self.fetch_pages(page_numbers)))
+            pages_fetched += len(page_numbers)
+            next_page = page_numbers.stop
+
+        if not complete:
+            # A page that failed could have held any stored listing, none of them is taken as removed
+            removed = []
+        elif reached_known:
+            # Only listings newer than the oldest one we crawled could have disappeared
+            removed = store.sweep(crawl, newer_than=oldest_date or "")
+        else:
+            removed = store.sweep(crawl)
+            store.set_reconciled_at(time.time())
+
+        if complete and self.checkpoint:
+            self.checkpoint.clear()
+
+        delta = ScrapeDelta(added, changed, removed, pages_fetched)
+        print(f"Fetched {pages_fetched} of {last_page} pages: {len(added)} added, "
+              f"{len(changed)} changed, {len(removed)} removed.")
+        return delta
+
+    def to_dataframe(self):
+        return normalize_listings(self.all_items)
+
+    def save_to_parquet(self, filename, df=None):
+        if df is not None:
+            df.to_parquet(filename, index=False)
+            print(f"Data has been saved to '{filename}'.")
+            return
+        with ParquetSink(filename) as sink:
+            stream_listings(chunked(self.all_items, STREAM_CHUNK_SIZE), [sink])
+
+    def save_to_excel(self, filename, df=None):
+        if df is not None:
+            write_excel(df, filename)
+            print(f"Data has been saved to '{filename}'.")
+            return
+        with ExcelSink(filename) as sink:
+            stream_listings(chunked(self.all_items, STREAM_CHUNK_SIZE), [sink])
+
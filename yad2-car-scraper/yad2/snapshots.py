@@ -0,0 +1,116 @@
+import threading
+
+from .cache import LRUCache
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+class Snapshot:
+    def __init__(self, df, updated_at, version):
+        self.df = df
+        self.updated_at = updated_at
+        # The registry version, the same in every process
+        self.version = version
+        self.search_columns = {}
+        self.sort_orders = {}
+        self.positions = None
+
+    def search_column(self, column):
+        # Lowercase text of a column as it is displayed, computed once per snapshot
+        text = self.search_columns.get(column)
+        if text is None:
+            text = self.df[column].astype("string[pyarrow]").str.lower().fillna("")
+            self.search_columns[column] = text
+        return text
+
+    def sort_order(self, column, ascending=True):
+        # Row positions sorted by a column, missing values last
+        order = self.sort_orders.get((column, ascending))
+        if order is None:
+            values = self.df[column].reset_index(drop=True)
+            order = values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+            self.sort_orders[(column, ascending)] = order
+        return order
+
+    def position(self, ad_id):
+        # Row of a listing, the lookup table is built once per snapshot
+        positions = self.positions
+        if positions is None:
+            positions = self.positions = {key: i for i, key in enumerate(self.df["ad_id"].tolist())}
+        return positions.get(ad_id)
+
+    def filter(self, filters):
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, value in filters.items():
+            mask &= self.search_column(column).str.contains(value.lower(), regex=False).to_numpy(dtype=bool)
+        return mask
+
+class SnapshotCache:
+    def __init__(self, registry, keys, loader, size):
+        # keys maps a name to its registry key, loader crawls a name and returns the version it published
+        self.registry = registry
+        self.keys = keys
+        self.loader = loader
+        self.snapshots = LRUCache(size)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def current_version(self, name):
+        return self.registry.current_version(self.keys[name])
+
+    def get(self, name, version=None):
+        # The newest version unless one is asked for, None when there is no such version
+        version = version or self.current_version(name)
+        if version is None:
+            return None
+        snapshot = self.snapshots.get((name, version))
+        if snapshot is None:
+            try:
+                df, updated_at = self.registry.open(self.keys[name], version)
+            except (OSError, ValueError) as e:
+                print(f"Failed to open version {version} of {name}: {e}")
+                return None
+            snapshot = Snapshot(df, updated_at, version)
+            self.snapshots.put((name, version), snapshot)
+        return snapshot
+
+    def refresh(self, name):
+        # Only one refresh per name runs at a time, concurrent callers wait for its result
+        with self.lock:
+            done = self.in_flight.get(name)
+            is_owner = done is None
+            if is_owner:
+                done = self.in_flight[name] = threading.Event()
+        if not is_owner:
+            done.wait()
+            return self.get(name)
+
+        try:
+            self.loader(name)
+        except Exception as e:
+            print(f"Failed to refresh data for {name}: {e}")
+        finally:
+            with self.lock:
+                del self.in_flight[name]
+            done.set()
+        return self.get(name)
+
+    def get_or_refresh(self, name):
+        return self.get(name) or self.refresh(name)
+
+class RefreshScheduler(threading.Thread):
+    def __init__(self, cache, names, interval):
+        super().__init__(daemon=True)
+        self.cache = cache
+        self.names = list(names)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for name in self.names:
+                self.cache.refresh(name)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,201 @@
+import functools
+import itertools
+import json
+import os
+
+from .lazy import lazy_import
+from .listings import normalize_listings
+from .metrics import STAGE_SECONDS
+from .schema import DATE_COLUMNS, LISTING_COLUMNS, LISTING_DTYPES, compact_item
+from .scoring import score_table
+
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+openpyxl = lazy_import("openpyxl")
+
+@STAGE_SECONDS.labels("excel").time()
+def write_excel(df, target):
+    with pd.ExcelWriter(target, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False)
+        format_listings_sheet(writer.sheets['Sheet1'], list(df.columns), len(df))
+
+def format_listings_sheet(worksheet, columns, rows):
+    last_column = openpyxl.utils.get_column_letter(max(len(columns), 1))
+    worksheet.auto_filter.ref = f"A1:{last_column}{rows + 1}"
+
+    def apply_conditional_formatting(name, start_color, mid_color, end_color):
+        if name not in columns:
+            return
+        column = openpyxl.utils.get_column_letter(columns.index(name) + 1)
+        color_scale = openpyxl.formatting.rule.ColorScaleRule(
+            start_type='min', start_color=start_color,
+            mid_type='percentile', mid_value=50, mid_color=mid_color,
+            end_type='max', end_color=end_color
+        )
+        worksheet.conditional_formatting.add(f'{column}2:{column}{rows + 1}', color_scale)
+
+    apply_conditional_formatting('kilometers', '00FF00', 'FFFF00', 'FF0000')
+    apply_conditional_formatting('price', 'FF0000', 'FFFF00', '00FF00')
+    apply_conditional_formatting('hand', 'FF0000', 'FFFF00', '00FF00')
+    apply_conditional_formatting('deal_score', 'FF0000', 'FFFF00', '00FF00')
+
+def arrow_type(dtype):
+    if dtype == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype == "Int64":
+        return pa.int64()
+    return pa.string()
+
+@functools.lru_cache(maxsize=None)
+def arrow_schema():
+    # Fixed so that every chunk appended to a Parquet file has the same schema
+    return pa.schema([(column, pa.timestamp("ns") if column in DATE_COLUMNS else arrow_type(LISTING_DTYPES[column]))
+                      for column in LISTING_COLUMNS])
+
+def chunked(items, size):
+    # Lists of at most size items, also from a generator
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def stream_listings(pages, sinks):
+    # Normalizes each page of raw items once and hands both to every sink
+    seen_ids = set()
+    rows = 0
+    for items in pages:
+        df = normalize_listings(items)
+        ad_ids = df["ad_id"]
+        # Listings can move between pages while crawling, keep their first appearance
+        new = ad_ids.isna() | ~(ad_ids.isin(seen_ids) | ad_ids.duplicated())
+        seen_ids.update(ad_ids.dropna())
+        df = df[new].reset_index(drop=True)
+        for sink in sinks:
+            with STAGE_SECONDS.labels(f"persist_{sink.stage}").time():
+                sink.write(items, df)
+        rows += len(df)
+    return rows
+
+class ListingSink:
+    # Writes to a temporary file that replaces filename only when closed without errors
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.tmp"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def close(self):
+        with STAGE_SECONDS.labels(f"persist_{self.stage}").time():
+            self.finish()
+        os.replace(self.tmp_filename, self.filename)
+        print(f"Data has been saved to '{self.filename}'.")
+
+    def abort(self):
+        self.finish()
+        if os.path.exists(self.tmp_filename):
+            os.remove(self.tmp_filename)
+
+class JsonLinesSink(ListingSink):
+    stage = "jsonl"
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.file = open(self.tmp_filename, "w", encoding="utf-8")
+
+    def write(self, items, df):
+        # Compact items, the same whether they come from the feed or from the listing store
+        for item in items:
+            self.file.write(json.dumps(compact_item(item), ensure_ascii=False))
+            self.file.write("\n")
+
+    def finish(self):
+        self.file.close()
+
+class ParquetSink(ListingSink):
+    stage = "parquet"
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.writer = None
+
+    def write(self, items, df):
+        if df.empty:
+            return
+        table = pa.Table.from_pandas(df[LISTING_COLUMNS], preserve_index=False)
+        if self.writer is None:
+            # The pandas metadata of the first chunk restores the nullable and categorical dtypes on read
+            self.schema = arrow_schema().with_metadata(table.schema.metadata)
+            self.writer = pq.ParquetWriter(self.tmp_filename, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def finish(self):
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_filename, arrow_schema())
+        self.writer.close()
+
+class ArrowSink(ListingSink):
+    # Uncompressed Arrow IPC file that readers memory map instead of loading
+    stage = "arrow"
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.tables = []
+
+    def write(self, items, df):
+        if not df.empty:
+            self.tables.append(pa.Table.from_pandas(df[LISTING_COLUMNS], preserve_index=False))
+
+    def finish(self):
+        if self.tables is None:
+            return
+        # IPC files hold a single dictionary per categorical column, so the chunks are written at once
+        if self.tables:
+            schema = arrow_schema().with_metadata(self.tables[0].schema.metadata)
+            table = pa.concat_tables([table.cast(schema) for table in self.tables]).unify_dictionaries()
+        else:
+            table = arrow_schema().empty_table()
+        # Listings are scored against the whole dataset, so every version is written with its scores
+        table = score_table(table)
+        with pa.ipc.new_file(self.tmp_filename, table.schema,
+                             options=pa.ipc.IpcWriteOptions(unify_dictionaries=True)) as writer:
+            writer.write_table(table)
+        self.tables = None
+
+    def abort(self):
+        # Nothing is written, the dataset is not scored either
+        self.tables = None
+        super().abort()
+
+class ExcelSink(ListingSink):
+    stage = "excel"
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet("Sheet1")
+        self.worksheet.append(LISTING_COLUMNS)
+        self.rows = 0
+
+    def write(self, items, df):
+        values = df[LISTING_COLUMNS].astype(object)
+        for row in values.where(values.notna(), None).itertuples(index=False):
+            self.worksheet.append(list(row))
+        self.rows += len(df)
+
+    def finish(self):
+        if self.workbook is None:
+            return
+        format_listings_sheet(self.worksheet, LISTING_COLUMNS, self.rows)
+        self.workbook.save(self.tmp_filename)
+        self.workbook = None
+
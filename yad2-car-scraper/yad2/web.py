@@ -0,0 +1,335 @@
+import cProfile
+import functools
+import importlib
+import io
+import json
+import os
+import threading
+import time
+
+from flask import (Blueprint, Flask, Response, abort, current_app, g, jsonify, make_response, render_template,
+                   request, send_file, url_for)
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+
+from .cache import LRUCache
+from .config import (DATASET_DIR, HISTORY_DB, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_MAX_AGE,
+                     IMAGE_THUMBNAIL_SIZE, MAX_PAGE_LENGTH, PLOT_ANNOTATION_BUDGET, PLOT_CACHE_SIZE, PLOT_MAX_AGE,
+                     PLOT_MAX_POINTS, PROFILE_DIR, PROFILE_REQUESTS, PROFILE_SLOW_SECONDS, REFRESH_INTERVAL,
+                     REGRESSION_CACHE_SIZE, SNAPSHOT_CACHE_SIZE, WARM_UP_MODULES, manufacturers_models)
+from .crawl import manufacturer_params, refresh_dataset
+from .history import PriceHistory
+from .images import ImageCache, ImagePrefetcher
+from .lazy import lazy_import
+from .metrics import HTTP_REQUEST_SECONDS, STAGE_SECONDS
+from .regression import PlotRenderer, compute_regression, regression_filters
+from .registry import DatasetRegistry
+from .schema import LISTING_COLUMNS, SCORE_COLUMNS
+from .snapshots import RefreshScheduler, SnapshotCache
+from .storage import write_excel
+
+np = lazy_import("numpy")
+
+bp = Blueprint("yad2", __name__, template_folder="templates")
+# Since Python 3.12 only one profiler can be active per process, requests that overlap a profiled one are not profiled
+profile_lock = threading.Lock()
+
+class AppState:
+    # Everything one application instance keeps between requests
+    def __init__(self, history_db, dataset_dir, image_dir, warm_up=True, refresh=True):
+        self.price_history = PriceHistory(history_db)
+        self.registry = DatasetRegistry(dataset_dir)
+        self.image_cache = ImageCache(image_dir, IMAGE_CACHE_MAX_BYTES, IMAGE_THUMBNAIL_SIZE)
+        self.images = ImagePrefetcher(self.image_cache)
+        self.dataset_keys = {name: self.registry.dataset_key(manufacturer_params(name))
+                             for name in manufacturers_models}
+        self.snapshot_cache = SnapshotCache(
+            self.registry, self.dataset_keys,
+            functools.partial(refresh_dataset, registry=self.registry, history=self.price_history,
+                              images=self.images),
+            SNAPSHOT_CACHE_SIZE)
+        self.regression_cache = LRUCache(REGRESSION_CACHE_SIZE)
+        self.plot_renderer = PlotRenderer(PLOT_CACHE_SIZE, PLOT_ANNOTATION_BUDGET, PLOT_MAX_POINTS)
+        self.scheduler = None
+        self.refresh_pending = refresh
+        self.warm_up_pending = warm_up
+        self.lock = threading.Lock()
+
+    def start_warm_up(self):
+        # Started by the first request rather than at import time, so that preforking
+        # servers only start the thread in the workers and never fork in the middle of an import
+        with self.lock:
+            if not self.warm_up_pending:
+                return
+            self.warm_up_pending = False
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def start_scheduler(self):
+        # Started by the first request as well, so that every worker of a preloading server runs its own
+        # scheduler and the parent process of the debug reloader runs none
+        with self.lock:
+            if not self.refresh_pending:
+                return
+            self.refresh_pending = False
+            self.scheduler = RefreshScheduler(self.snapshot_cache, manufacturers_models, REFRESH_INTERVAL)
+        self.scheduler.start()
+
+    def warm_up(self):
+        for name in manufacturers_models:
+            self.snapshot_cache.get(name)
+        for module in WARM_UP_MODULES:
+            importlib.import_module(module)
+
+def create_app(history_db=HISTORY_DB, dataset_dir=DATASET_DIR, image_dir=IMAGE_CACHE_DIR, refresh=True,
+               warm_up=True):
+    # refresh crawls every manufacturer each REFRESH_INTERVAL seconds in the background
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    app.extensions["yad2"] = AppState(history_db, dataset_dir, image_dir, warm_up, refresh)
+    return app
+
+def app_state():
+    return current_app.extensions["yad2"]
+
+def requested_snapshot(manufacturer, version):
+    # A page pins the dataset version it was rendered with, even when a newer one was published since
+    snapshot_cache = app_state().snapshot_cache
+    if not version:
+        return snapshot_cache.get_or_refresh(manufacturer)
+    snapshot = snapshot_cache.get(manufacturer, version)
+    if snapshot is None:
+        abort(410)
+    return snapshot
+
+def load_plot(manufacturer, version, key):
+    state = app_state()
+    return (state.plot_renderer.get(key)
+            or state.registry.load_plot(state.dataset_keys[manufacturer], version, key))
+
+def render_page(template, **context):
+    with STAGE_SECONDS.labels("template_render").time():
+        return render_template(template, **context)
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{int(seconds)} seconds"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} minutes"
+    return f"{seconds / 3600:.1f} hours"
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    state = app_state()
+    state.start_scheduler()
+    state.start_warm_up()
+    if PROFILE_REQUESTS and profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool is active
+            profile_lock.release()
+            return
+        g.profiler = profiler
+
+@bp.after_app_request
+def record_request_time(response):
+    elapsed = time.perf_counter() - g.request_start
+    HTTP_REQUEST_SECONDS.labels(request.endpoint or "unknown", str(response.status_code)).observe(elapsed)
+    profiler = stop_profiler()
+    if profiler is not None:
+        # Only slow requests are kept, open the dumps with pstats or snakeviz
+        if elapsed >= PROFILE_SLOW_SECONDS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            filename = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{elapsed:.2f}s.prof")
+            profiler.dump_stats(filename)
+            print(f"Slow request to {request.path} took {elapsed:.2f} seconds, profile saved to '{filename}'.")
+    return response
+
+def stop_profiler():
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        profile_lock.release()
+    return profiler
+
+@bp.teardown_app_request
+def release_profiler(exc):
+    # After a request that failed before its response was processed
+    stop_profiler()
+
+@bp.route('/metrics')
+def metrics():
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Under a preforking server every worker writes its samples to this directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+@bp.route('/linear_regression', methods=['POST'])
+def linear_regression():
+    state = app_state()
+    manufacturer = request.form.get('manufacturer', 'Hyundai')
+    snapshot = (requested_snapshot(manufacturer, request.form.get('version'))
+                if manufacturer in manufacturers_models else None)
+    result = None
+    if snapshot is not None:
+        # Filter according to the selected status
+        filters = regression_filters(request.form, snapshot.df.columns)
+        key = (manufacturer, snapshot.version, filters)
+        result = state.regression_cache.get(key)
+        # The plot may have been evicted from its own cache, render it again with the fit
+        if result is None or (result.count and load_plot(manufacturer, snapshot.version, result.plot_key) is None):
+            result, image = compute_regression(manufacturer, snapshot, filters, state.plot_renderer)
+            if image is not None:
+                # Saved next to the dataset version, so that any worker can serve it. The rendered image is
+                # used rather than the plot cache, which another request may have evicted it from already.
+                state.registry.save_plot(state.dataset_keys[manufacturer], snapshot.version, result.plot_key, image)
+            state.regression_cache.discard_if(
+                lambda cached: cached[0] == manufacturer and cached[1] != snapshot.version)
+            state.regression_cache.put(key, result)
+
+    if result is None or result.count == 0:
+        return render_page("regression_empty.html")
+
+    return render_page("regression.html", plot_url=url_for('yad2.plot_image', manufacturer=manufacturer,
+                                                           version=snapshot.version, key=result.plot_key,
+                                                           _external=True))
+
+@bp.route('/plot/<manufacturer>/<version>/<key>.png')
+def plot_image(manufacturer, version, key):
+    if manufacturer not in manufacturers_models:
+        abort(404)
+    image = load_plot(manufacturer, version, key)
+    if image is None:
+        abort(404)
+    response = make_response(image)
+    response.mimetype = 'image/png'
+    # The key already identifies the dataset version and filters, so the image never changes
+    response.headers['Cache-Control'] = f'public, max-age={PLOT_MAX_AGE}, immutable'
+    response.set_etag(key)
+    return response.make_conditional(request)
+
+@bp.route('/export/<manufacturer>.xlsx')
+def export_excel(manufacturer):
+    if manufacturer not in manufacturers_models:
+        abort(404)
+    snapshot = requested_snapshot(manufacturer, request.args.get('version'))
+    if snapshot is None:
+        abort(503)
+    output = io.BytesIO()
+    write_excel(snapshot.df, output)
+    output.seek(0)
+    return send_file(output, as_attachment=True, download_name=f"yad2_vehicles_{manufacturer}.xlsx",
+                     mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+def datatables_columns(args):
+    columns = []
+    i = 0
+    while f"columns[{i}][data]" in args:
+        columns.append((args[f"columns[{i}][data]"], args.get(f"columns[{i}][search][value]", "")))
+        i += 1
+    return columns
+
+@bp.route('/api/listings')
+def listings_api():
+    # Server side processing protocol of DataTables
+    args = request.args
+    manufacturer = args.get('manufacturer', 'Hyundai')
+    if manufacturer not in manufacturers_models:
+        abort(404)
+    draw = args.get('draw', 0, type=int)
+    snapshot = requested_snapshot(manufacturer, args.get('version'))
+    if snapshot is None:
+        return jsonify(draw=draw, recordsTotal=0, recordsFiltered=0, data=[])
+    df = snapshot.df
+
+    columns = [(column, value) for column, value in datatables_columns(args) if column in df.columns]
+    filters = {column: value for column, value in columns if value}
+    mask = snapshot.filter(filters)
+    global_search = args.get('search[value]', '').lower()
+    if global_search:
+        any_match = np.zeros(len(df), dtype=bool)
+        for column, _ in columns:
+            any_match |= snapshot.search_column(column).str.contains(global_search, regex=False).to_numpy(dtype=bool)
+        mask &= any_match
+
+    order_column = args.get('order[0][column]', type=int)
+    if order_column is not None and order_column < len(columns):
+        ascending = args.get('order[0][dir]') != 'desc'
+        positions = snapshot.sort_order(columns[order_column][0], ascending)
+        positions = positions[mask[positions]]
+    else:
+        positions = np.flatnonzero(mask)
+
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 10, type=int)
+    if length < 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+    # Images are loaded by the gallery from /api/listings/<ad_id>/images when it is opened
+    page = df.iloc[positions[start:start + length]].drop(columns="images_urls")
+    data = page.astype("string").fillna("").to_dict(orient="records")
+
+    return jsonify(draw=draw, recordsTotal=len(df), recordsFiltered=len(positions), data=data)
+
+@bp.route('/api/listings/<ad_id>/images')
+def listing_images_api(ad_id):
+    manufacturer = request.args.get('manufacturer', 'Hyundai')
+    if manufacturer not in manufacturers_models:
+        abort(404)
+    snapshot = requested_snapshot(manufacturer, request.args.get('version'))
+    position = snapshot.position(ad_id) if snapshot is not None else None
+    if position is None:
+        abort(404)
+    images_urls = snapshot.df["images_urls"].iat[position]
+    urls = json.loads(images_urls) if isinstance(images_urls, str) else []
+    hashes = app_state().images.fetch_all(urls)
+    # An image that could not be fetched is linked at its source
+    images = [url_for('yad2.thumbnail', image_hash=hashes[url]) if url in hashes else url for url in urls]
+    return jsonify(ad_id=ad_id, images=images)
+
+@bp.route('/img/<image_hash>')
+def thumbnail(image_hash):
+    path = app_state().image_cache.load(image_hash)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype='image/jpeg', etag=image_hash, conditional=True)
+    # The name is the hash of the thumbnail, so it never changes
+    response.headers['Cache-Control'] = f'public, max-age={IMAGE_MAX_AGE}, immutable'
+    return response
+
+@bp.route('/api/history/listing/<ad_id>')
+def listing_history_api(ad_id):
+    return jsonify(ad_id=ad_id, history=app_state().price_history.listing_history(ad_id))
+
+@bp.route('/api/history/model')
+def model_history_api():
+    model = request.args.get('model')
+    if not model:
+        abort(400)
+    submodel = request.args.get('submodel', '')
+    days = request.args.get('days', 90, type=int)
+    window = request.args.get('window', 7, type=int)
+    return jsonify(model=model, submodel=submodel,
+                   history=app_state().price_history.model_history(model, submodel, days, max(window, 1)))
+
+@bp.route('/', methods=['GET', 'POST'])
+def display_data():
+    selected_manufacturer = request.form.get('manufacturer', 'Hyundai')
+    if selected_manufacturer not in manufacturers_models:
+        selected_manufacturer = 'Hyundai'
+    # The page itself never loads the data, the table fetches its rows from /api/listings
+    state = app_state()
+    dataset_version = state.snapshot_cache.current_version(selected_manufacturer)
+    snapshot_age = None
+    if dataset_version is not None:
+        try:
+            updated_at = state.registry.updated_at(state.dataset_keys[selected_manufacturer], dataset_version)
+            snapshot_age = format_age(time.time() - updated_at)
+        except OSError:
+            dataset_version = None
+
+    return render_page("index.html", columns=LISTING_COLUMNS + SCORE_COLUMNS, manufacturers_models=manufacturers_models,
+                       selected_manufacturer=selected_manufacturer, snapshot_age=snapshot_age,
+                       dataset_version=dataset_version)